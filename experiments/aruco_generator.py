@@ -30,7 +30,7 @@ def generate_aruco_patterns_image(dictionary_name, num_patterns, marker_size=100
     image_height = grid_rows * (marker_size + 10)
     
     # Create a blank white image
-    output_image = np.ones((image_height, image_width), dtype=np.uint8) * 255
+    output_image = np.full((image_height, image_width), 255, dtype=np.uint8)
 
     print(f"Generating {num_patterns} ArUco patterns from {dict_str_name}...")
 
@@ -228,7 +228,7 @@ class ImageViewerApp:
         if detect_charuco_board:
             logging.info(f"Attempting ChArUco board detection with params: X={self.CHARUCO_SQUARES_X}, Y={self.CHARUCO_SQUARES_Y}, SqL={self.CHARUCO_SQUARE_LENGTH_MM}, MkL={self.CHARUCO_MARKER_LENGTH_MM}, Dict={self.CHARUCO_DICTIONARY_NAME}")
             try:
-                charuco_result_image = detect_charuco_board(
+                charuco_result_image, _, _, _, _ = detect_charuco_board(
                     image_with_qrs,
                     self.CHARUCO_SQUARES_X, self.CHARUCO_SQUARES_Y,
                     self.CHARUCO_SQUARE_LENGTH_MM, self.CHARUCO_MARKER_LENGTH_MM,
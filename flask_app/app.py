@@ -46,25 +46,49 @@ Configuration:
   `client_secret.json` file if the environment variable is not set.
 """
 from flask import Flask, request, render_template, jsonify, send_file, session, redirect, url_for, flash
+from flask.json.provider import DefaultJSONProvider
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 import google.oauth2.credentials
 from googleapiclient.errors import HttpError
 import google.auth.transport.requests # Moved here
 import googleapiclient.http # Added
+import google_auth_httplib2
+import httplib2
 import os
 import cv2
 import numpy as np
-import base64
+try:
+    import pybase64 as base64 # SIMD (AVX2/AVX-512) base64 codec, same API as the stdlib module
+except ImportError:
+    import base64
 import json
 from werkzeug.utils import secure_filename
 import logging
-from PIL import Image
+import logging.handlers
+import queue
+import atexit
 import io
+import shutil
 import glob
 import os
 from werkzeug.middleware.proxy_fix import ProxyFix # Added ProxyFix
 import re # Added for regex operations
+from functools import lru_cache
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Let OpenCV use its SIMD paths and its parallel backend inside cvtColor, resize,
+# imdecode and the ArUco loops. With several Gunicorn workers (WEB_CONCURRENCY),
+# the cores are split between them to avoid oversubscription.
+cv2.setUseOptimized(True)
+cv2.setNumThreads(int(os.environ.get(
+    'CV_NUM_THREADS',
+    max(1, (os.cpu_count() or 4) // int(os.environ.get('WEB_CONCURRENCY', 1)))
+)))
 
 # Get the absolute path of the directory where app.py is located
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
@@ -72,21 +96,65 @@ APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 
 # Optional imports with error handling
 try:
+    from qreader import QReader
     from utils.detect_and_draw_qr import detect_and_draw_qrcodes
 except ImportError:
     logging.error("Failed to import detect_and_draw_qrcodes from detect_and_draw_qr. QR detection will be skipped.")
+    QReader = None
     detect_and_draw_qrcodes = None
 
 try:
-    from utils.charuco_detector import detect_charuco_board
+    from utils.charuco_detector import create_charuco_detector, detect_charuco_board, draw_charuco_detections
 except ImportError:
     logging.error("Failed to import detect_charuco_board")
+    create_charuco_detector = None
     detect_charuco_board = None
+    draw_charuco_detections = None
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJFLAG_PROGRESSIVE
+    _TURBO_JPEG = TurboJPEG()
+except Exception: # ImportError, or OSError/RuntimeError when libturbojpeg itself is missing
+    logging.info("PyTurboJPEG not available. Falling back to cv2.imencode for JPEG encoding.")
+    _TURBO_JPEG = None
+
+try:
+    import orjson
+except ImportError:
+    logging.info("orjson not available. Falling back to the standard JSON provider.")
+    orjson = None
+
+try:
+    from flask_session import Session
+    from cachelib.file import FileSystemCache
+except ImportError:
+    logging.warning("Flask-Session not available. Falling back to cookie-based sessions.")
+    Session = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
 
 
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
+if orjson is not None:
+    class OrjsonProvider(DefaultJSONProvider):
+        """JSON provider that serializes with orjson.
+
+        Used by `jsonify` and `app.json`; the JSON endpoints hit for every
+        image then go through the C serializer without any call-site changes.
+        """
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=kwargs.get('default', self.default), option=orjson.OPT_NON_STR_KEYS).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'a-default-fallback-secret-key-if-not-set') # It's better to use environment variables for secret keys
 
 # If app is behind one proxy (e.g., Cloud Run's frontend)
@@ -101,13 +169,34 @@ if not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
     app.logger.setLevel(logging.INFO) # Set desired logging level
     handler = logging.StreamHandler() # Log to stderr
     handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'))
-    app.logger.addHandler(handler)
+    # Request threads only enqueue records; formatting and the write to stderr
+    # happen on the listener's background thread.
+    _log_queue = queue.SimpleQueue()
+    app.logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+    _log_listener = logging.handlers.QueueListener(_log_queue, handler)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
 
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
 app.config['UPLOAD_FOLDER'] = os.path.join(APP_ROOT, 'uploads')
 app.config['DRIVE_TEMP_FOLDER'] = os.path.join(APP_ROOT, 'drive_temp_downloads')
 app.config['SERVER_IMAGES_FOLDER'] = os.path.join(APP_ROOT, 'shared_data') # This maps to /app/shared_data in Docker
 
+# Keep session data (image path lists, credentials) on the server; the cookie only
+# carries the session ID. Signed cookies are capped at ~4 KB and re-sent on every request.
+# Redis is used when `REDIS_URL` is set, so sessions survive container restarts
+# and can be shared between instances; otherwise they are kept on local disk.
+if Session is not None:
+    if os.environ.get('REDIS_URL') and redis is not None:
+        app.config['SESSION_TYPE'] = 'redis'
+        app.config['SESSION_REDIS'] = redis.Redis.from_url(os.environ['REDIS_URL'])
+    else:
+        if os.environ.get('REDIS_URL'):
+            logging.warning("REDIS_URL is set but the redis package is not available. Using filesystem sessions.")
+        app.config['SESSION_TYPE'] = 'cachelib'
+        app.config['SESSION_CACHELIB'] = FileSystemCache(os.path.join(APP_ROOT, 'flask_session'), threshold=1000)
+    Session(app)
+
 # Ensure directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['DRIVE_TEMP_FOLDER'], exist_ok=True)
@@ -116,6 +205,8 @@ os.makedirs(app.config['SERVER_IMAGES_FOLDER'], exist_ok=True)
 # Google OAuth Configuration
 CLIENT_SECRETS_FILE = 'client_secret.json' # IMPORTANT: This file needs to be obtained from Google Cloud Console
 SCOPES = ['https://www.googleapis.com/auth/drive.metadata.readonly', 'https://www.googleapis.com/auth/drive.readonly']
+# Fields a stored credentials dict needs to rebuild google.oauth2.credentials.Credentials
+_REQUIRED_CRED_KEYS = frozenset(('token', 'refresh_token', 'token_uri', 'client_id', 'client_secret', 'scopes'))
 
 # ChArUco configuration
 CHARUCO_CONFIG = {
@@ -126,6 +217,108 @@ CHARUCO_CONFIG = {
     'DICTIONARY_NAME': "DICT_4X4_100"
 }
 
+# Image file extensions accepted from uploads and the server images folder
+_ALLOWED_EXTS = frozenset({'png', 'jpg', 'jpeg', 'bmp', 'gif'})
+
+# Buffer size used when streaming uploaded files to disk (1 MiB)
+UPLOAD_COPY_BUFFER_SIZE = 1 << 20
+
+# Leading bytes ("magic numbers") of the accepted image formats
+_IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+
+# Longest image edge (in pixels) used for detection; larger inputs are downscaled first.
+# QR and ChArUco detection quality saturates well below typical phone camera resolutions.
+MAX_DETECTION_DIMENSION = 1600
+
+# Longest edge (in pixels), JPEG quality and encoding mode of the previews shown
+# in the UI. Progressive JPEGs with optimized Huffman tables are typically 10-15%
+# smaller at the same quality, and render coarse-to-fine while loading.
+PREVIEW_MAX_DIMENSION = 1024
+PREVIEW_JPEG_QUALITY = 80
+PREVIEW_JPEG_PROGRESSIVE = True
+
+# Maximum number of processed results kept in memory for fast re-navigation
+PROCESSED_CACHE_SIZE = 64
+
+# Processed results for in-memory images (e.g. Drive downloads), keyed by a
+# hash of the encoded bytes plus the ChArUco configuration (oldest evicted first)
+_RESULTS_BY_DIGEST = OrderedDict()
+_RESULTS_BY_DIGEST_LOCK = threading.Lock()
+
+# Encoded JPEGs served by `/image/<token>.jpg`, keyed by content hash (oldest evicted first)
+IMAGE_STORE_SIZE = 256
+# A token always names the same bytes, so browsers may reuse an image without revalidating
+IMAGE_CACHE_CONTROL = 'private, max-age=600, immutable'
+_IMAGE_STORE = OrderedDict()
+_IMAGE_STORE_LOCK = threading.Lock()
+
+# Freshly uploaded images decoded in memory, keyed by their path in UPLOAD_FOLDER.
+# Entries are consumed by the first `process_image` call for that path.
+DECODED_UPLOADS_SIZE = 8
+_DECODED_UPLOADS = OrderedDict()
+_DECODED_UPLOADS_LOCK = threading.Lock()
+
+# Media download endpoint of the Drive v3 API, and the read size used to stream it
+DRIVE_MEDIA_URL = 'https://www.googleapis.com/drive/v3/files/{file_id}?alt=media'
+DRIVE_DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Drive API clients keyed by access token. A refreshed token gets a new entry
+# and the stale one ages out; the oldest entries are evicted first.
+DRIVE_SERVICE_CACHE_SIZE = 32
+_DRIVE_SERVICES = OrderedDict()
+_DRIVE_SERVICES_LOCK = threading.Lock()
+
+# Authorized HTTP sessions for Drive media downloads, keyed by access token like
+# the API clients above. Reusing a session keeps its connection pool, so
+# consecutive downloads and prefetches skip the TCP and TLS handshakes.
+_DRIVE_HTTP_SESSIONS = OrderedDict()
+_DRIVE_HTTP_SESSIONS_LOCK = threading.Lock()
+
+# Drive files downloaded in the background ahead of navigation, keyed by
+# (refresh token, file ID) so users never see each other's files. Values are
+# futures resolving to the file bytes; the oldest entries are evicted first.
+DRIVE_PREFETCH_AHEAD = 2
+DRIVE_PREFETCH_SIZE = 8
+_DRIVE_PREFETCH = OrderedDict()
+_DRIVE_PREFETCH_LOCK = threading.Lock()
+_DRIVE_PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=3, thread_name_prefix='drive-prefetch')
+
+# A QReader instance is not safe to run from several threads at once, so each
+# QR detection takes an idle instance from this pool and puts it back when
+# done; a new one is loaded only when all are busy. The pool thus grows to the
+# peak number of concurrent QR detections and no further.
+_QR_DETECTOR_POOL = queue.SimpleQueue()
+
+# QR and ChArUco detection are independent OpenCV/torch calls that release the
+# GIL, so a request runs them side by side: QR detection on this pool, ChArUco
+# detection in the request thread itself. The pool has a worker per server
+# thread (Gunicorn's --threads in the Dockerfile), so requests do not queue
+# behind each other's QR detection.
+DETECTION_THREADS = int(os.environ.get('DETECTION_THREADS', 8))
+_DETECTION_EXECUTOR = ThreadPoolExecutor(max_workers=DETECTION_THREADS, thread_name_prefix='detection')
+
+# Set in background threads (see `_UPLOAD_PRECOMPUTE_EXECUTOR`), whose
+# detections run serially in the thread instead of on `_DETECTION_EXECUTOR`.
+_DETECTION_THREAD_STATE = threading.local()
+
+def _run_detections_inline():
+    """Thread initializer: run this thread's detections without `_DETECTION_EXECUTOR`."""
+    _DETECTION_THREAD_STATE.inline = True
+
+# After an upload, the next few images are processed in the background so that
+# navigating to them hits the result cache. The count bounds the queued work
+# for large batches; the first image is left to the request the frontend sends
+# right after the upload.
+UPLOAD_PRECOMPUTE_COUNT = 8
+_UPLOAD_PRECOMPUTE_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-precompute',
+                                                  initializer=_run_detections_inline)
+
 def load_google_flow(scopes, redirect_uri, state=None):
     """Loads and configures the Google OAuth2 Flow object.
 
@@ -209,143 +402,708 @@ def request_entity_too_large(error):
         'message': f"The uploaded data exceeds the maximum allowed size of {max_length} bytes."
     }), 413
 
+def has_allowed_extension(filename):
+    """Checks whether a filename has one of the `_ALLOWED_EXTS` image extensions.
+
+    Args:
+        filename (str): The filename to check.
+
+    Returns:
+        bool: True if the extension (case-insensitive) is allowed.
+    """
+    _, dot, ext = filename.rpartition('.')
+    return bool(dot) and ext.lower() in _ALLOWED_EXTS
+
+def sniff_image_format(head):
+    """Identifies an image format from the first bytes of a file.
+
+    This is a cheap check that lets garbage or truncated uploads be rejected
+    before OpenCV spends time probing its decoders on them.
+
+    Args:
+        head (bytes): The first bytes of the file (12 are enough).
+
+    Returns:
+        str | None: The format name ('jpeg', 'png', 'gif' or 'bmp'), or None if
+            the bytes do not start with a known image signature.
+    """
+    for signature, image_format in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return None
+
+def encode_jpeg(cv_image, quality=85, progressive=False):
+    """Encodes an OpenCV image (numpy array) as JPEG bytes.
+
+    libjpeg-turbo (through PyTurboJPEG) is used when it is installed, otherwise
+    `cv2.imencode`. Both consume OpenCV's native BGR layout directly, so no color
+    conversion is needed before encoding.
+
+    Args:
+        cv_image (numpy.ndarray): The input image in OpenCV format (BGR color).
+        quality (int): JPEG quality, from 0 to 100.
+        progressive (bool): If True, encodes a progressive JPEG with optimized
+            Huffman tables, which is smaller but slightly slower to encode.
+
+    Returns:
+        bytes | None: The JPEG-encoded image, or None if the input `cv_image`
+            is None or could not be encoded.
+    """
+    if cv_image is None:
+        app.logger.warning("Input OpenCV image is None, returning None.")
+        return None
+
+    if _TURBO_JPEG is not None:
+        flags = TJFLAG_PROGRESSIVE if progressive else 0
+        return _TURBO_JPEG.encode(cv_image, quality=quality, pixel_format=TJPF_BGR, flags=flags)
+
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    if progressive:
+        params += [int(cv2.IMWRITE_JPEG_PROGRESSIVE), 1, int(cv2.IMWRITE_JPEG_OPTIMIZE), 1]
+    ok, buffer = cv2.imencode('.jpg', cv_image, params)
+    if not ok:
+        app.logger.error("Failed to encode OpenCV image as JPEG.")
+        return None
+    return buffer.tobytes()
+
+def encode_preview(cv_image, max_dimension=PREVIEW_MAX_DIMENSION, quality=PREVIEW_JPEG_QUALITY,
+                   progressive=PREVIEW_JPEG_PROGRESSIVE):
+    """Encodes a display-sized JPEG preview of an OpenCV image.
+
+    The browser shows images in cards a few hundred pixels wide, so the image is
+    shrunk to at most `max_dimension` pixels on its longest edge before encoding.
+    JPEG cost and payload size both scale with pixel count.
+
+    Args:
+        cv_image (numpy.ndarray): The input image in OpenCV format (BGR color).
+        max_dimension (int): Maximum length of the longest edge, in pixels.
+        quality (int): JPEG quality, from 0 to 100.
+        progressive (bool): Whether to encode a progressive JPEG.
+
+    Returns:
+        bytes | None: The JPEG-encoded preview, or None if the input `cv_image`
+            is None or could not be encoded.
+    """
+    if cv_image is not None:
+        height, width = cv_image.shape[:2]
+        scale = max_dimension / max(height, width)
+        if scale < 1.0:
+            cv_image = cv2.resize(cv_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return encode_jpeg(cv_image, quality=quality, progressive=progressive)
+
 def cv_image_to_base64(cv_image):
     """Converts an OpenCV image (numpy array) to a base64 encoded string.
 
     This is used to embed image data directly into HTML or JSON responses for
-    display in a web browser. The image is converted from BGR (OpenCV's default)
-    to RGB, then saved as a JPEG in-memory, and finally base64 encoded.
+    display in a web browser. The image is JPEG-encoded with `encode_jpeg` and
+    the result is base64 encoded.
 
     Args:
         cv_image (numpy.ndarray): The input image in OpenCV format (BGR color).
 
     Returns:
         str | None: A data URI string (e.g., "data:image/jpeg;base64,...")
-            representing the image, or None if the input `cv_image` is None.
+            representing the image, or None if the input `cv_image` is None
+            or could not be encoded.
     """
-    app.logger.info("Attempting to convert OpenCV image to base64.")
-    if cv_image is None:
-        app.logger.warning("Input OpenCV image is None, returning None.")
+    jpeg_bytes = encode_jpeg(cv_image)
+    if jpeg_bytes is None:
         return None
-    
-    # Convert BGR to RGB
-    app.logger.debug("Converting BGR to RGB.")
-    rgb_image = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
-    pil_image = Image.fromarray(rgb_image)
-    app.logger.debug("Converted to PIL image.")
-    
-    # Convert to base64
-    buffer = io.BytesIO()
-    pil_image.save(buffer, format='JPEG', quality=85)
-    image_base64 = base64.b64encode(buffer.getvalue()).decode()
-    app.logger.info("Successfully converted OpenCV image to base64 JPEG.")
+    image_base64 = base64.b64encode(jpeg_bytes).decode('ascii')
     return f"data:image/jpeg;base64,{image_base64}"
 
-def process_image(image_path, return_image_object=False):
+def store_image(jpeg_bytes):
+    """Stores JPEG bytes in the in-process image store and returns their URL.
+
+    Processed images are served by the `/image/<token>.jpg` endpoint rather than
+    embedded in JSON as base64 data URIs, which keeps the JSON payload small
+    and lets the browser fetch, decode and cache the images natively. The
+    token is a hash of the content, so storing the same image twice yields
+    the same URL.
+
+    Args:
+        jpeg_bytes (bytes | None): The JPEG-encoded image.
+
+    Returns:
+        str | None: The URL the image can be fetched from, or None if
+            `jpeg_bytes` is None.
+    """
+    if jpeg_bytes is None:
+        return None
+    token = hashlib.blake2b(jpeg_bytes, digest_size=16).hexdigest()
+    with _IMAGE_STORE_LOCK:
+        _IMAGE_STORE[token] = jpeg_bytes
+        _IMAGE_STORE.move_to_end(token)
+        while len(_IMAGE_STORE) > IMAGE_STORE_SIZE:
+            _IMAGE_STORE.popitem(last=False)
+    return url_for('serve_image', token=token)
+
+def publish_result_images(result):
+    """Replaces the JPEG bytes in a processing result with image URLs.
+
+    Args:
+        result (dict): A result dictionary from `process_image`. It is updated
+            in place.
+
+    Returns:
+        dict: The same `result` dictionary, now JSON serializable.
+    """
+    for key in ('original_image', 'processed_image'):
+        result[key] = store_image(result.get(key))
+    return result
+
+def decode_image_bytes(data):
+    """Decodes an encoded image (JPEG, PNG, ...) held in memory.
+
+    Args:
+        data (bytes | memoryview): The encoded image bytes.
+
+    Returns:
+        numpy.ndarray | None: The decoded BGR image, or None if it could not be decoded.
+    """
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def stash_decoded_upload(image_path, data):
+    """Decodes uploaded image bytes and keeps the result for `process_image`.
+
+    Args:
+        image_path (str): The path the upload was saved to; used as the key.
+        data (bytes): The raw bytes of the uploaded file.
+
+    Returns:
+        bool: True if the bytes were decoded and stashed, False otherwise.
+    """
+    cv_image = decode_image_bytes(data)
+    if cv_image is None:
+        app.logger.warning(f"Could not decode uploaded image in memory: {image_path}")
+        return False
+    with _DECODED_UPLOADS_LOCK:
+        _DECODED_UPLOADS[image_path] = cv_image
+        while len(_DECODED_UPLOADS) > DECODED_UPLOADS_SIZE:
+            _DECODED_UPLOADS.popitem(last=False)
+    return True
+
+def pop_decoded_upload(image_path):
+    """Returns and forgets the in-memory decoded image for `image_path`, if any."""
+    with _DECODED_UPLOADS_LOCK:
+        return _DECODED_UPLOADS.pop(image_path, None)
+
+def acquire_qr_detector():
+    """Takes an idle QReader instance from the pool, loading a new one if none is idle.
+
+    The caller has exclusive use of the instance until it hands it back with
+    `release_qr_detector`.
+
+    Returns:
+        QReader | None: The detector, or None if qreader is not installed.
+    """
+    if QReader is None:
+        return None
+    try:
+        return _QR_DETECTOR_POOL.get_nowait()
+    except queue.Empty:
+        app.logger.info("Loading QReader model.")
+        return QReader()
+
+def release_qr_detector(detector):
+    """Puts a detector from `acquire_qr_detector` back into the pool."""
+    if detector is not None:
+        _QR_DETECTOR_POOL.put(detector)
+
+@lru_cache(maxsize=4)
+def _build_charuco_detector(config_key):
+    """Builds the ChArUco detector for a `charuco_config_key()` value."""
+    config = dict(config_key)
+    return create_charuco_detector(
+        config['SQUARES_X'], config['SQUARES_Y'],
+        config['SQUARE_LENGTH_MM'], config['MARKER_LENGTH_MM'],
+        config['DICTIONARY_NAME']
+    )
+
+def get_charuco_detector():
+    """Returns the shared ChArUco detector for the current `CHARUCO_CONFIG`.
+
+    The ArUco dictionary, board layout and detector parameters only depend on
+    the board configuration, so they are built once per configuration and
+    reused by every request instead of being rebuilt for each image.
+
+    Returns:
+        cv2.aruco.CharucoDetector | None: The detector, or None if the ChArUco
+            module is not available or the dictionary name is invalid.
+    """
+    if create_charuco_detector is None:
+        return None
+    return _build_charuco_detector(charuco_config_key())
+
+def detect_qrcodes_shared(cv_image):
+    """Runs `detect_and_draw_qrcodes` with a QReader instance from the pool.
+
+    Args:
+        cv_image (numpy.ndarray): The image to scan, in BGR format.
+
+    Returns:
+        tuple: The return value of `detect_and_draw_qrcodes`.
+    """
+    detector = acquire_qr_detector()
+    try:
+        return detect_and_draw_qrcodes(cv_image, detector=detector)
+    finally:
+        release_qr_detector(detector)
+
+def warm_up_detectors():
+    """Runs both detectors once on a tiny blank image.
+
+    The first detection call pays for one-time lazy initialization (loading the
+    QReader model, OpenCV's ArUco internals), often hundreds of milliseconds.
+    Calling this at startup moves that cost from the first user request to
+    server boot. Failures are logged and otherwise ignored.
+    """
+    blank_image = np.zeros((64, 64, 3), dtype=np.uint8)
+    if detect_and_draw_qrcodes:
+        try:
+            detect_qrcodes_shared(blank_image)
+        except Exception as e:
+            app.logger.warning(f"QR detector warm-up failed: {e}")
+    if detect_charuco_board:
+        try:
+            detect_charuco_board(
+                cv2.cvtColor(blank_image, cv2.COLOR_BGR2GRAY),
+                CHARUCO_CONFIG['SQUARES_X'], CHARUCO_CONFIG['SQUARES_Y'],
+                CHARUCO_CONFIG['SQUARE_LENGTH_MM'], CHARUCO_CONFIG['MARKER_LENGTH_MM'],
+                CHARUCO_CONFIG['DICTIONARY_NAME'], display=False, detector=get_charuco_detector(), draw=False
+            )
+        except Exception as e:
+            app.logger.warning(f"ChArUco detector warm-up failed: {e}")
+
+def _call_as_future(fn, *args, **kwargs):
+    """Calls `fn` in the current thread and returns its outcome as a completed Future."""
+    future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def downscale_for_detection(cv_image, max_dimension=MAX_DETECTION_DIMENSION):
+    """Downscales an image so that its longest edge is at most `max_dimension`.
+
+    Detection cost grows roughly linearly with pixel count, so running QR and
+    ChArUco detection on a bounded-size image keeps per-request CPU and memory
+    predictable regardless of the camera resolution.
+
+    Args:
+        cv_image (numpy.ndarray): The input image in OpenCV format (BGR color).
+        max_dimension (int): The maximum allowed length of the longest edge.
+
+    Returns:
+        tuple[numpy.ndarray, float]: The (possibly) resized image and the scale
+            factor applied. Detected coordinates can be mapped back to the
+            original image by dividing by the scale. If the image is already
+            small enough it is returned unchanged with a scale of 1.0.
+    """
+    height, width = cv_image.shape[:2]
+    scale = min(1.0, float(max_dimension) / max(height, width))
+    if scale >= 1.0:
+        return cv_image, 1.0
+    resized = cv2.resize(cv_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(f"Downscaled image from {width}x{height} to {resized.shape[1]}x{resized.shape[0]} for detection.")
+    return resized, scale
+
+def process_image(image_path, return_image_object=False, cv_image=None, max_dimension=MAX_DETECTION_DIMENSION):
     """Loads an image from a file path and processes it for ChArUco and QR codes.
 
-    This function performs the core image analysis:
-    1. Reads the image file using OpenCV.
-    2. Converts the original image to base64 for display.
-    3. Calls `detect_and_draw_qrcodes` to find and decode QR codes, drawing on a copy.
-    4. Calls `detect_charuco_board` on the (potentially QR-annotated) image.
-    5. Converts the final processed image to base64.
+    Reads the file with OpenCV (unless an already decoded `cv_image` is given)
+    and hands it to `process_cv_image`.
 
     Args:
         image_path (str): The local file system path to the image to be processed.
         return_image_object (bool): If True, the function returns the processed
                                     OpenCV image object instead of the dictionary.
+        cv_image (numpy.ndarray, optional): An already decoded image for
+            `image_path`. If given, the file is not read from disk.
+        max_dimension (int | None): See `process_cv_image`.
+
+    Returns:
+        dict or numpy.ndarray: See `process_cv_image`.
+    """
+    if cv_image is None:
+        cv_image = cv2.imread(image_path)
+        if cv_image is None:
+            app.logger.error(f"Failed to load image from path: {image_path}")
+    return process_cv_image(cv_image, image_path, return_image_object, max_dimension)
 
+def process_cv_image(cv_image, image_label, return_image_object=False, max_dimension=MAX_DETECTION_DIMENSION):
+    """Processes a decoded image for ChArUco and QR codes.
+
+    This function performs the core image analysis:
+    1. Downscales the image to at most `max_dimension` pixels on the longest
+       edge.
+    2. Encodes a JPEG preview of the original image for display.
+    3. Runs `detect_and_draw_qrcodes` (on `_DETECTION_EXECUTOR`) and
+       `detect_charuco_board` (in the calling thread) concurrently on the image,
+       then draws the ChArUco detections onto the QR-annotated copy.
+    4. Encodes a JPEG preview of the final processed image, reusing the original one when
+       no detector produced an annotated image.
+
+    Args:
+        cv_image (numpy.ndarray | None): The image in OpenCV format (BGR color).
+        image_label (str): Identifies the image in log messages (a path or a
+            file name).
+        return_image_object (bool): If True, the function returns the processed
+                                    OpenCV image object instead of the dictionary.
+        max_dimension (int | None): The longest edge the image is downscaled to
+            before detection. None keeps the full resolution, e.g. to save the
+            processed image at the size of the original.
 
     Returns:
         dict or numpy.ndarray: A dictionary containing the processing results,
             or the processed OpenCV image object if return_image_object is True.
-            - 'original_image' (str): Base64 encoded original image.
-            - 'processed_image' (str): Base64 encoded image with detections drawn.
+            - 'original_image' (bytes): JPEG preview of the original image.
+            - 'processed_image' (bytes): JPEG preview of the image with detections drawn.
             - 'charuco_detected' (bool): True if a ChArUco board was found.
             - 'qr_codes' (list[str]): A list of decoded string data from QR codes.
             - 'qr_codes_json' (list[dict]): A list of decoded JSON objects from QR codes.
-            Returns a dictionary with default values if the image cannot be loaded.
+            - 'detection_scale' (float): The factor the image was resized by before
+              detection (1.0 if it was not downscaled). Divide detected pixel
+              coordinates by it to map them back to the full-resolution image.
+            Returns a dictionary with default values (or None if
+            return_image_object is True) if `cv_image` is None.
     """
-    app.logger.info(f"Starting image processing for: {image_path}")
+    start_time = time.perf_counter()
     result = {
         'original_image': None,
         'processed_image': None,
         'charuco_detected': False,
         'qr_codes': [],
-        'qr_codes_json': []
+        'qr_codes_json': [],
+        'detection_scale': 1.0
     }
-    
-    # Load image
-    app.logger.info(f"Loading image from path: {image_path}")
-    cv_image = cv2.imread(image_path)
+
     if cv_image is None:
-        app.logger.error(f"Failed to load image from path: {image_path}")
         return result if not return_image_object else None
+
+    if max_dimension is not None:
+        cv_image, result['detection_scale'] = downscale_for_detection(cv_image, max_dimension)
+
+    # Encode original image for display
+    result['original_image'] = encode_preview(cv_image)
     
-    app.logger.info(f"Successfully loaded image: {image_path}")
-    # Convert original image to base64
-    result['original_image'] = cv_image_to_base64(cv_image)
-    
-    # Start with copy for processing
-    processed_image = cv_image.copy()
-    app.logger.debug("Created a copy of the image for processing.")
-    
-    # QR Code detection
+    # Detectors draw on their own copies; only keep a reference to whichever
+    # annotated image comes back instead of duplicating the input up front.
+    processed_image = None
+
+    # QR code and ChArUco detection both run on the clean image, concurrently.
+    # The ChArUco overlay is composited onto the QR-annotated image afterwards.
+    qr_future = None
     if detect_and_draw_qrcodes:
-        app.logger.info("Attempting QR code detection.")
+        if getattr(_DETECTION_THREAD_STATE, 'inline', False):
+            qr_future = _call_as_future(detect_qrcodes_shared, cv_image)
+        else:
+            qr_future = _DETECTION_EXECUTOR.submit(detect_qrcodes_shared, cv_image)
+    else:
+        app.logger.warning("detect_and_draw_qrcodes module not available. Skipping QR detection.")
+
+    charuco_count = 0
+    charuco_future = None
+    if detect_charuco_board:
+        # ArUco detection works on grayscale; converting once here spares the
+        # detector the conversion and a full-color copy of the image.
+        gray_image = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
+        charuco_future = _call_as_future(
+            detect_charuco_board,
+            gray_image,
+            CHARUCO_CONFIG['SQUARES_X'], CHARUCO_CONFIG['SQUARES_Y'],
+            CHARUCO_CONFIG['SQUARE_LENGTH_MM'], CHARUCO_CONFIG['MARKER_LENGTH_MM'],
+            CHARUCO_CONFIG['DICTIONARY_NAME'], display=False, detector=get_charuco_detector(),
+            draw=False # The overlay is drawn below, onto the QR-annotated image
+        )
+    else:
+        app.logger.warning("detect_charuco_board module not available. Skipping ChArUco detection.")
+
+    if qr_future is not None:
         try:
-            qr_images, qr_decoded_texts, qr_decoded_json_objects = detect_and_draw_qrcodes(cv_image)
-            if qr_images and len(qr_images) > 0 and qr_images[0] is not None:
+            qr_images, qr_decoded_texts, qr_decoded_json_objects = qr_future.result()
+            # Without QR outlines the first image is cv_image itself, which must not be drawn on
+            if qr_images and len(qr_images) > 0 and qr_images[0] is not None and qr_images[0] is not cv_image:
                 processed_image = qr_images[0]
-                app.logger.info(f"QR code detection successful. Found {len(qr_decoded_texts)} QR codes.")
                 if qr_decoded_texts:
                     result['qr_codes'] = qr_decoded_texts
                     result['qr_codes_json'] = qr_decoded_json_objects
-            else:
-                app.logger.info("QR code detection ran, but no QR codes found or image not returned.")
         except Exception as e:
-            app.logger.error(f"Exception during QR code detection for {image_path}: {e}", exc_info=True)
-    else:
-        app.logger.warning("detect_and_draw_qrcodes module not available. Skipping QR detection.")
+            app.logger.error(f"Exception during QR code detection for {image_label}: {e}", exc_info=True)
 
-    # ChArUco detection
-    if detect_charuco_board:
+    if charuco_future is not None:
         try:
-            charuco_output, charuco_corners, charuco_ids, marker_corners, marker_ids = detect_charuco_board(
-                processed_image,
-                CHARUCO_CONFIG['SQUARES_X'], CHARUCO_CONFIG['SQUARES_Y'],
-                CHARUCO_CONFIG['SQUARE_LENGTH_MM'], CHARUCO_CONFIG['MARKER_LENGTH_MM'],
-                CHARUCO_CONFIG['DICTIONARY_NAME'], display=False
-            )
+            charuco_output, charuco_corners, charuco_ids, marker_corners, marker_ids = charuco_future.result()
             if charuco_output is not None:
-                processed_image = charuco_output
                 if charuco_ids is not None and len(charuco_ids) > 0:
-                    app.logger.info(f"ChArUco board detection successful. Found {len(charuco_ids)} ChArUco IDs.")
+                    if processed_image is None:
+                        # A downscaled image is already a private buffer whose
+                        # preview has been encoded, so it can be drawn on directly.
+                        if result['detection_scale'] < 1.0:
+                            processed_image = cv_image
+                        else:
+                            processed_image = cv_image.copy()
+                    draw_charuco_detections(processed_image, charuco_corners, charuco_ids, marker_corners, marker_ids)
+                    charuco_count = len(charuco_ids)
                     result['charuco_detected'] = True
-                else:
-                    app.logger.info("ChArUco board detection ran, image updated, but no ChArUco IDs found.")
-            else:
-                app.logger.info("ChArUco board detection ran but returned None.")
         except Exception as e:
-            app.logger.error(f"Exception during ChArUco board detection for {image_path}: {e}", exc_info=True)
-    else:
-        app.logger.warning("detect_charuco_board module not available. Skipping ChArUco detection.")
+            app.logger.error(f"Exception during ChArUco board detection for {image_label}: {e}", exc_info=True)
 
     if return_image_object:
-        return processed_image
+        return processed_image if processed_image is not None else cv_image
 
-    result['processed_image'] = cv_image_to_base64(processed_image)
-    app.logger.info(f"Finished image processing for: {image_path}. Charuco detected: {result['charuco_detected']}, QR codes: {len(result['qr_codes'])}")
+    if processed_image is None:
+        # Nothing was drawn, so the processed image is the original one
+        result['processed_image'] = result['original_image']
+    else:
+        result['processed_image'] = encode_preview(processed_image)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    app.logger.info(f"Processed {image_label}: qr_count={len(result['qr_codes'])}, charuco_count={charuco_count}, ms_elapsed={elapsed_ms:.1f}")
     return result
 
+def charuco_config_key():
+    """Returns `CHARUCO_CONFIG` as a hashable value for use in cache keys."""
+    return tuple(sorted(CHARUCO_CONFIG.items()))
+
+@lru_cache(maxsize=PROCESSED_CACHE_SIZE)
+def _process_image_cached(image_path, mtime_ns, size, config_key=None):
+    """Memoized wrapper around `process_image`.
+
+    `mtime_ns`, `size` and `config_key` are not used directly; they are part of
+    the cache key so that a file modified on disk, or a changed ChArUco
+    configuration, is re-processed instead of served stale.
+    """
+    return process_image(image_path, cv_image=pop_decoded_upload(image_path))
+
+def process_image_cached(image_path):
+    """Processes an image, reusing a previous result if the file is unchanged.
+
+    Navigating back and forth between images is very common in the UI, and the
+    QR + ChArUco detection pipeline is by far the most expensive part of each
+    request. Results are cached in-process keyed by (path, mtime, size) and the
+    ChArUco configuration. Stat-based keys are used rather than content hashes
+    so that a cache hit does not have to read the file at all.
+
+    Args:
+        image_path (str): The local file system path to the image to be processed.
+
+    Returns:
+        dict: A fresh copy of the result dictionary returned by `process_image`,
+            safe for the caller to update with navigation metadata.
+    """
+    try:
+        st = os.stat(image_path)
+    except OSError as e:
+        app.logger.error(f"Could not stat image file {image_path}: {e}")
+        return process_image(image_path)
+    return dict(_process_image_cached(image_path, st.st_mtime_ns, st.st_size, charuco_config_key()))
+
+def process_image_bytes_cached(data, image_label):
+    """Decodes and processes an encoded image, reusing results for identical bytes.
+
+    Used for images that only exist in memory, such as Drive downloads, which
+    have no path or mtime to key on. Revisiting a Drive image skips both the
+    decode and the detection.
+
+    Args:
+        data (bytes): The encoded image (JPEG, PNG, ...).
+        image_label (str): Identifies the image in log messages.
+
+    Returns:
+        dict: A fresh copy of the result dictionary returned by `process_cv_image`,
+            safe for the caller to update with navigation metadata.
+    """
+    key = (hashlib.blake2b(data, digest_size=16).digest(), charuco_config_key())
+    with _RESULTS_BY_DIGEST_LOCK:
+        result = _RESULTS_BY_DIGEST.get(key)
+        if result is not None:
+            _RESULTS_BY_DIGEST.move_to_end(key)
+            return dict(result)
+
+    cv_image = decode_image_bytes(data)
+    if cv_image is None:
+        app.logger.error(f"Failed to decode image '{image_label}'.")
+        return process_cv_image(None, image_label)
+    result = process_cv_image(cv_image, image_label)
+    with _RESULTS_BY_DIGEST_LOCK:
+        _RESULTS_BY_DIGEST[key] = result
+        while len(_RESULTS_BY_DIGEST) > PROCESSED_CACHE_SIZE:
+            _RESULTS_BY_DIGEST.popitem(last=False)
+    return dict(result)
+
+def get_drive_service(credentials):
+    """Returns a Drive v3 API client for the given credentials, reusing a cached one.
+
+    Building a client parses the Drive discovery document, which is far more
+    work than the few API calls a request makes with it. Clients are built once
+    per access token from the discovery document bundled with the library, so no
+    discovery request is ever sent. Each API request gets its own `httplib2`
+    connection, since a cached client can be used by several threads at once.
+
+    Args:
+        credentials (google.oauth2.credentials.Credentials): The user's credentials,
+            already refreshed if they were expired.
+
+    Returns:
+        googleapiclient.discovery.Resource: The Drive API client.
+    """
+    key = credentials.token
+    with _DRIVE_SERVICES_LOCK:
+        service = _DRIVE_SERVICES.get(key)
+        if service is not None:
+            _DRIVE_SERVICES.move_to_end(key)
+            return service
+
+    def build_request(http, *args, **kwargs):
+        authed_http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+        return googleapiclient.http.HttpRequest(authed_http, *args, **kwargs)
+
+    service = build('drive', 'v3', credentials=credentials, requestBuilder=build_request,
+                    cache_discovery=False, static_discovery=True)
+    with _DRIVE_SERVICES_LOCK:
+        _DRIVE_SERVICES[key] = service
+        while len(_DRIVE_SERVICES) > DRIVE_SERVICE_CACHE_SIZE:
+            _DRIVE_SERVICES.popitem(last=False)
+    return service
+
+def get_drive_http_session(credentials):
+    """Returns a cached `AuthorizedSession` for the given credentials.
+
+    Args:
+        credentials (google.oauth2.credentials.Credentials): The user's credentials.
+
+    Returns:
+        google.auth.transport.requests.AuthorizedSession: A session whose
+            connection pool is shared by all downloads made with the same token.
+    """
+    key = credentials.token
+    with _DRIVE_HTTP_SESSIONS_LOCK:
+        authed_session = _DRIVE_HTTP_SESSIONS.get(key)
+        if authed_session is not None:
+            _DRIVE_HTTP_SESSIONS.move_to_end(key)
+            return authed_session
+        authed_session = google.auth.transport.requests.AuthorizedSession(credentials)
+        _DRIVE_HTTP_SESSIONS[key] = authed_session
+        # Evicted sessions are not closed: a download may still be streaming
+        # through one, and its connections are released once it is collected
+        while len(_DRIVE_HTTP_SESSIONS) > DRIVE_SERVICE_CACHE_SIZE:
+            _DRIVE_HTTP_SESSIONS.popitem(last=False)
+    return authed_session
+
+def _precompute_upload(image_path):
+    """Processes an uploaded image on the precompute pool, logging any failure."""
+    try:
+        process_image_cached(image_path)
+    except Exception as e:
+        app.logger.warning(f"Background processing of {image_path} failed: {e}")
+
+def precompute_uploads(image_paths):
+    """Queues background processing of freshly uploaded images.
+
+    Args:
+        image_paths (list[str]): File names of the uploaded images, relative to
+            `UPLOAD_FOLDER`, in display order.
+    """
+    for filename in image_paths[1:1 + UPLOAD_PRECOMPUTE_COUNT]:
+        _UPLOAD_PRECOMPUTE_EXECUTOR.submit(
+            _precompute_upload, os.path.join(app.config['UPLOAD_FOLDER'], filename))
+
+def download_drive_file(credentials, file_id, file_name):
+    """Downloads a Google Drive file into memory with a single streamed GET.
+
+    `MediaIoBaseDownload` fetches files in 100 KB ranges, one HTTPS round trip
+    each; a single `alt=media` request streams the whole file over one
+    connection instead. The connection is kept alive for the next download
+    made with the same credentials.
+
+    Args:
+        credentials (google.oauth2.credentials.Credentials): The user's credentials.
+        file_id (str): The ID of the file to download.
+        file_name (str): The file name, used in log messages.
+
+    Returns:
+        bytes: The content of the file.
+
+    Raises:
+        HttpError: If Drive answers with an error status, so callers can handle
+            it like the errors raised by the Drive API client.
+    """
+    authed_session = get_drive_http_session(credentials)
+    with authed_session.get(DRIVE_MEDIA_URL.format(file_id=file_id), stream=True) as response:
+        if response.status_code != 200:
+            raise HttpError(httplib2.Response({'status': response.status_code}), response.content, uri=response.url)
+        fh = io.BytesIO()
+        for chunk in response.iter_content(chunk_size=DRIVE_DOWNLOAD_CHUNK_SIZE):
+            fh.write(chunk)
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(f"Successfully downloaded Drive file '{file_name}' ({fh.tell()} bytes).")
+    return fh.getvalue()
+
+def _download_drive_file_with_credentials(creds_dict, file_id, file_name):
+    """Downloads a Drive file using stored credentials.
+
+    Runs on the prefetch pool, where the Flask session is not available.
+    """
+    credentials = google.oauth2.credentials.Credentials(**creds_dict)
+    return download_drive_file(credentials, file_id, file_name)
+
+def prefetch_drive_files(creds_dict, drive_files, index):
+    """Starts background downloads of the Drive files following `index`.
+
+    Downloads are network-bound and release the GIL, so fetching the next
+    `DRIVE_PREFETCH_AHEAD` files overlaps with processing the current one and
+    makes "next" navigation skip the download.
+
+    Args:
+        creds_dict (dict): The user's stored Google credentials.
+        drive_files (list[dict]): The Drive file list from the session.
+        index (int): The index of the image currently being processed.
+    """
+    user_key = creds_dict.get('refresh_token')
+    with _DRIVE_PREFETCH_LOCK:
+        for next_file in drive_files[index + 1:index + 1 + DRIVE_PREFETCH_AHEAD]:
+            key = (user_key, next_file['id'])
+            if key in _DRIVE_PREFETCH:
+                continue
+            _DRIVE_PREFETCH[key] = _DRIVE_PREFETCH_EXECUTOR.submit(
+                _download_drive_file_with_credentials, dict(creds_dict), next_file['id'], next_file['name']
+            )
+            while len(_DRIVE_PREFETCH) > DRIVE_PREFETCH_SIZE:
+                _DRIVE_PREFETCH.popitem(last=False)
+
+def get_prefetched_drive_file(creds_dict, file_id):
+    """Returns the bytes of a prefetched Drive file, waiting if still downloading.
+
+    Args:
+        creds_dict (dict): The user's stored Google credentials.
+        file_id (str): The ID of the file.
+
+    Returns:
+        bytes | None: The file content, or None if it was not prefetched or the
+            prefetch failed.
+    """
+    key = (creds_dict.get('refresh_token'), file_id)
+    with _DRIVE_PREFETCH_LOCK:
+        future = _DRIVE_PREFETCH.get(key)
+    if future is None:
+        return None
+    try:
+        return future.result()
+    except Exception as e:
+        app.logger.warning(f"Prefetch of Drive file {file_id} failed, downloading directly: {e}")
+        with _DRIVE_PREFETCH_LOCK:
+            _DRIVE_PREFETCH.pop(key, None)
+        return None
+
 def get_processed_image_data(index):
     """Fetches and processes an image by its index, abstracting the source.
 
     This is a central helper that handles two modes based on the user's session:
     1.  **Google Drive Mode**: If a Drive folder is selected, it uses the index to
-        find the file ID, downloads the image to a temporary location, processes it,
-        and then deletes the temporary file. It also handles Google API token refresh.
+        find the file ID, downloads the image into memory, decodes and processes it.
+        It also handles Google API token refresh.
     2.  **Local Mode**: If images were uploaded locally, it uses the index to find
         the file path in the `uploads` folder and processes it.
 
@@ -359,12 +1117,13 @@ def get_processed_image_data(index):
     Returns:
         tuple[dict, int]: A tuple containing:
             - A dictionary with the processed data. On success, this includes
-              image data, navigation state ('current_index', 'total_images',
+              the image URLs, navigation state ('current_index', 'total_images',
               'has_next', 'has_prev'), and metadata ('filename', 'source').
               On error, it contains an 'error' key and may include a 'redirect' URL.
             - An integer representing the HTTP status code (e.g., 200, 400, 401, 404, 500).
     """
-    app.logger.info(f"Getting processed image data for index: {index}.")
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(f"Getting processed image data for index: {index}.")
 
     if session.get('selected_google_drive_folder_id') and session.get('drive_image_files') is not None:
         # Google Drive Mode
@@ -376,19 +1135,15 @@ def get_processed_image_data(index):
         image_info = drive_files[index]
         file_id = image_info['id']
         file_name = image_info['name']
-        secure_file_name = secure_filename(file_name) if file_name else f"unnamed_drive_file_{file_id}"
-        if not secure_file_name:
-            secure_file_name = f"drive_file_{file_id}"
-        temp_image_path = os.path.join(app.config['DRIVE_TEMP_FOLDER'], secure_file_name)
-        app.logger.info(f"Processing Drive file: ID='{file_id}', Name='{file_name}', Temp Path='{temp_image_path}'")
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug(f"Processing Drive file: ID='{file_id}', Name='{file_name}'")
 
         if 'google_credentials' not in session:
             return ({'error': 'Google session ended', 'redirect': url_for('login_google')}, 401)
 
-        download_attempted_or_successful = False
         try:
             creds_dict = session['google_credentials']
-            if not all(k in creds_dict for k in ['token', 'refresh_token', 'token_uri', 'client_id', 'client_secret', 'scopes']):
+            if not _REQUIRED_CRED_KEYS.issubset(creds_dict):
                 raise ValueError("Stored Google credentials missing required fields.")
 
             credentials = google.oauth2.credentials.Credentials(**creds_dict)
@@ -402,19 +1157,15 @@ def get_processed_image_data(index):
                 }
                 app.logger.info("Refreshed Google token for downloading image.")
 
-            service = build('drive', 'v3', credentials=credentials)
-            drive_request = service.files().get_media(fileId=file_id)
-
-            with io.FileIO(temp_image_path, 'wb') as fh:
-                downloader = googleapiclient.http.MediaIoBaseDownload(fh, drive_request)
-                done = False
-                while not done:
-                    status, done = downloader.next_chunk()
-                    app.logger.info(f"Download {file_name}: {int(status.progress() * 100)}%.")
-            app.logger.info(f"Successfully downloaded Drive file '{file_name}' to '{temp_image_path}'.")
-            download_attempted_or_successful = True
-
-            result_data = process_image(temp_image_path)
+            creds_dict = session['google_credentials']
+            # Download into memory and decode from there; no temporary file is written.
+            data = get_prefetched_drive_file(creds_dict, file_id)
+            if data is None:
+                data = download_drive_file(credentials, file_id, file_name)
+            # Fetch the next images while this one is being processed
+            prefetch_drive_files(creds_dict, drive_files, index)
+
+            result_data = publish_result_images(process_image_bytes_cached(data, file_name))
             result_data.update({
                 'current_index': index,
                 'total_images': len(drive_files),
@@ -440,13 +1191,6 @@ def get_processed_image_data(index):
         except Exception as e:
             app.logger.error(f"Unexpected error processing Drive file '{file_name}' (index {index}): {e}", exc_info=True)
             return ({'error': f"An unexpected error occurred while processing file '{file_name}'.", 'filename': file_name, 'current_index': index, 'total_images': len(drive_files), 'has_next': index < len(drive_files) - 1, 'has_prev': index > 0, 'is_api_error': True, 'source': 'drive'}, 500)
-        finally:
-            if download_attempted_or_successful and os.path.exists(temp_image_path):
-                try:
-                    os.remove(temp_image_path)
-                    app.logger.info(f"Successfully deleted temporary Drive file: {temp_image_path}")
-                except OSError as e_remove:
-                    app.logger.error(f"Error deleting temporary Drive file {temp_image_path}: {e_remove}")
     elif session.get('is_server_mode') and session.get('server_image_files') is not None: # New Server Mode
         server_files = session.get('server_image_files', [])
         if not (0 <= index < len(server_files)):
@@ -455,9 +1199,10 @@ def get_processed_image_data(index):
 
         file_name = server_files[index]
         image_path = os.path.join(app.config['SERVER_IMAGES_FOLDER'], file_name)
-        app.logger.info(f"Processing Server file: Name='{file_name}', Path='{image_path}'")
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug(f"Processing Server file: Name='{file_name}', Path='{image_path}'")
 
-        result_data = process_image(image_path)
+        result_data = publish_result_images(process_image_cached(image_path))
         result_data.update({
             'current_index': index,
             'total_images': len(server_files),
@@ -467,7 +1212,8 @@ def get_processed_image_data(index):
             'source': 'server'
         })
         session['current_server_image_index'] = index
-        app.logger.info(f"Successfully processed server image at index {index}: {file_name}. Returning data.")
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug(f"Successfully processed server image at index {index}: {file_name}. Returning data.")
         return result_data, 200
     else:
         # Local File Mode
@@ -477,13 +1223,14 @@ def get_processed_image_data(index):
             return ({'error': 'Invalid local image index'}, 400)
 
         image_path = os.path.join(app.config['UPLOAD_FOLDER'], image_paths[index])
-        result_data = process_image(image_path)
+        result_data = publish_result_images(process_image_cached(image_path))
         result_data.update({
             'current_index': index, 'total_images': len(image_paths), 'filename': image_paths[index],
             'has_next': index < len(image_paths) - 1, 'has_prev': index > 0, 'source': 'local'
         })
         session['current_index'] = index
-        app.logger.info(f"Successfully processed local image at index {index}: {image_paths[index]}. Returning data.")
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug(f"Successfully processed local image at index {index}: {image_paths[index]}. Returning data.")
         return result_data, 200
 
 @app.route('/')
@@ -621,7 +1368,7 @@ def drive_folders():
     try:
         creds_dict = session['google_credentials']
         # Ensure all required fields are present for Credentials object
-        if not all(k in creds_dict for k in ['token', 'refresh_token', 'token_uri', 'client_id', 'client_secret', 'scopes']):
+        if not _REQUIRED_CRED_KEYS.issubset(creds_dict):
             app.logger.error("Stored Google credentials missing required fields.")
             flash("Your Google session data is corrupted. Please log in again.", "error")
             session.pop('google_credentials', None) # Clear corrupted creds
@@ -652,7 +1399,7 @@ def drive_folders():
                 session.pop('state', None)
                 return redirect(url_for('login_google'))
 
-        service = build('drive', 'v3', credentials=credentials)
+        service = get_drive_service(credentials)
 
         results = service.files().list(
             q="mimeType='application/vnd.google-apps.folder' and trashed=false",
@@ -724,7 +1471,7 @@ def drive_select_folder(folder_id, folder_name):
         return redirect(url_for('login_google'))
     try:
         creds_dict = session['google_credentials']
-        if not all(k in creds_dict for k in ['token', 'refresh_token', 'token_uri', 'client_id', 'client_secret', 'scopes']):
+        if not _REQUIRED_CRED_KEYS.issubset(creds_dict):
             app.logger.error("Stored Google credentials missing required fields when fetching folder content.")
             flash("Your Google session data is corrupted. Please log in again.", "error")
             session.pop('google_credentials', None)
@@ -741,7 +1488,7 @@ def drive_select_folder(folder_id, folder_name):
             }
             app.logger.info("Refreshed Google token for fetching folder content.")
 
-        service = build('drive', 'v3', credentials=credentials)
+        service = get_drive_service(credentials)
         query = f"'{folder_id}' in parents and (mimeType='image/jpeg' or mimeType='image/png' or mimeType='image/bmp' or mimeType='image/gif') and trashed=false"
         results = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
         items = results.get('files', [])
@@ -844,7 +1591,7 @@ def process_drive_link():
 
     try:
         creds_dict = session['google_credentials']
-        if not all(k in creds_dict for k in ['token', 'refresh_token', 'token_uri', 'client_id', 'client_secret', 'scopes']):
+        if not _REQUIRED_CRED_KEYS.issubset(creds_dict):
             app.logger.error("Stored Google credentials missing required fields for process_drive_link.")
             session.pop('google_credentials', None)
             return jsonify({'success': False, 'error': 'Google session data corrupted. Please log in again.', 'redirect': url_for('login_google')}), 401
@@ -860,7 +1607,7 @@ def process_drive_link():
             }
             app.logger.info("Refreshed Google token for processing Drive link.")
 
-        service = build('drive', 'v3', credentials=credentials)
+        service = get_drive_service(credentials)
 
         # Get folder name
         folder_metadata = service.files().get(fileId=folder_id, fields='id, name').execute()
@@ -968,7 +1715,7 @@ def select_server_images():
         # Recursively scan the directory for image files
         for root, _, files in os.walk(server_images_dir):
             for filename in files:
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
+                if has_allowed_extension(filename):
                     # Store the path relative to the base server images directory
                     relative_path = os.path.relpath(os.path.join(root, filename), server_images_dir)
                     server_image_files.append(relative_path)
@@ -994,13 +1741,16 @@ def upload_files():
     This is an API endpoint for the file upload form. It receives a list of files,
     clears any existing Google Drive session data, saves the valid image files to
     the configured `UPLOAD_FOLDER`, and stores their filenames in the session.
+    The images after the first are then processed in the background (see
+    `precompute_uploads`).
 
     Returns:
         flask.Response: A JSON response containing:
             - 'success' (bool): True if the operation was successful.
             - 'image_count' (int): The number of valid images successfully uploaded.
             - 'images' (list[str]): A list of the filenames of the uploaded images.
-            Returns a JSON error response if no files are provided.
+            Returns a JSON error response if no files are provided, or with status
+            400 if every file with an image extension failed the magic-number check.
     """
     # Clear Drive session variables if local files are uploaded
     session.pop('selected_google_drive_folder_id', None)
@@ -1013,11 +1763,12 @@ def upload_files():
     app.logger.info("Cleared Google Drive session variables due to local file upload.")
 
     app.logger.info(f"Received file upload request from {request.remote_addr}")
-    app.logger.info(f"Request Headers: {request.headers}")
-    app.logger.info(f"Request Form data: {request.form}")
-    app.logger.info(f"Request Files: {request.files}")
-    if request.data:
-        app.logger.info(f"Request Raw Data: {request.data[:200]}...") # Log first 200 bytes if raw data exists
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(f"Request Headers: {request.headers}")
+        app.logger.debug(f"Request Form data: {request.form}")
+        app.logger.debug(f"Request Files: {request.files}")
+        if request.data:
+            app.logger.debug(f"Request Raw Data: {request.data[:200]}...") # Log first 200 bytes if raw data exists
 
     if 'files[]' not in request.files:
         app.logger.warning("Upload request received, but 'files[]' not in request.files.")
@@ -1025,20 +1776,39 @@ def upload_files():
     
     files = request.files.getlist('files[]')
     image_paths = []
+    rejected_files = []
     
     for file in files:
         if file and file.filename:
-            app.logger.info(f"File details - Name: {file.name}, Filename: {file.filename}, ContentType: {file.content_type}, ContentLength: {file.content_length}")
+            if app.logger.isEnabledFor(logging.DEBUG):
+                app.logger.debug(f"File details - Name: {file.name}, Filename: {file.filename}, ContentType: {file.content_type}, ContentLength: {file.content_length}")
             filename = secure_filename(file.filename)
-            app.logger.info(f"Processing uploaded file: {filename}")
+            if app.logger.isEnabledFor(logging.DEBUG):
+                app.logger.debug(f"Processing uploaded file: {filename}")
             # Log more details about the file object if needed, e.g., file.headers
             # app.logger.info(f"File headers for {filename}: {file.headers}")
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
+            if has_allowed_extension(filename):
                 filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
                 try:
-                    file.save(filepath)
+                    head = file.stream.read(12)
+                    file.stream.seek(0)
+                    if sniff_image_format(head) is None:
+                        app.logger.warning(f"Rejected file {filename}: content is not a recognized image format.")
+                        rejected_files.append(filename)
+                        continue
+                    if not image_paths:
+                        # The frontend shows the first image right after the upload,
+                        # so decode it now from memory instead of re-reading it from disk.
+                        data = file.stream.read()
+                        with open(filepath, 'wb') as dst:
+                            dst.write(data)
+                        stash_decoded_upload(filepath, data)
+                    else:
+                        with open(filepath, 'wb') as dst:
+                            shutil.copyfileobj(file.stream, dst, UPLOAD_COPY_BUFFER_SIZE)
                     image_paths.append(filename)
-                    app.logger.info(f"Saved uploaded file to: {filepath}")
+                    if app.logger.isEnabledFor(logging.DEBUG):
+                        app.logger.debug(f"Saved uploaded file to: {filepath}")
                 except Exception as e:
                     app.logger.error(f"Error saving uploaded file {filename} to {filepath}: {e}", exc_info=True)
             else:
@@ -1046,10 +1816,14 @@ def upload_files():
         else:
             app.logger.warning("Encountered a file object without a filename in upload.")
     
+    if rejected_files and not image_paths:
+        return jsonify({'error': 'Uploaded files are not valid images', 'rejected': rejected_files}), 400
+
     # Store in session
     session['image_paths'] = image_paths
     session['current_index'] = 0 if image_paths else -1
     app.logger.info(f"Stored {len(image_paths)} image paths in session. Current index: {session['current_index']}.")
+    precompute_uploads(image_paths)
     return jsonify({
         'success': True,
         'image_count': len(image_paths),
@@ -1072,12 +1846,69 @@ def process_image_route(index):
         flask.Response: A JSON response containing the processed image data and
             navigation state, along with the appropriate HTTP status code.
     """
-    app.logger.info(f"Process image route invoked for index: {index}.")
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(f"Process image route invoked for index: {index}.")
     data, status_code = get_processed_image_data(index)
     # Flash messages are generally for page loads/redirects, not direct AJAX responses.
     # The frontend should handle errors from the JSON data.
     return jsonify(data), status_code
 
+@app.route('/image/<token>.jpg')
+def serve_image(token):
+    """Serves a processed or original image from the in-process image store.
+
+    The URLs for this endpoint are produced by `store_image` and returned in
+    the JSON of `/process/<index>` and `/navigate/<direction>`; the frontend
+    assigns them directly to the `<img>` elements.
+
+    The token is a hash of the image content, so it doubles as the ETag. A
+    revalidation whose `If-None-Match` carries the token gets an empty 304,
+    even if the image has since been evicted from the store.
+
+    Args:
+        token (str): The content hash identifying the stored JPEG.
+
+    Returns:
+        flask.Response: The JPEG image, an empty 304 response if the browser's
+            copy is current, or a JSON error with status 404 if the token is
+            unknown or has been evicted from the store.
+    """
+    if request.if_none_match.contains(token):
+        response = app.response_class(status=304)
+        response.set_etag(token)
+        response.headers['Cache-Control'] = IMAGE_CACHE_CONTROL
+        return response
+
+    with _IMAGE_STORE_LOCK:
+        jpeg_bytes = _IMAGE_STORE.get(token)
+    if jpeg_bytes is None:
+        app.logger.warning(f"Requested image token not found in store: {token}")
+        return jsonify({'error': 'Image not found'}), 404
+    response = send_file(io.BytesIO(jpeg_bytes), mimetype='image/jpeg', etag=token)
+    response.headers['Cache-Control'] = IMAGE_CACHE_CONTROL
+    return response
+
+# Index offset of each navigation direction
+_NAV_DELTAS = {'next': 1, 'prev': -1}
+
+def _clamp_nav(current_index, total_images, direction):
+    """Computes the image index to navigate to.
+
+    Args:
+        current_index (int): The index of the current image.
+        total_images (int): The number of images in the current source.
+        direction (str): The direction to navigate, either 'next' or 'prev'.
+
+    Returns:
+        int or None: The new index, which stays at `current_index` when moving
+            past either end of the sequence, or None if `direction` is invalid.
+    """
+    delta = _NAV_DELTAS.get(direction)
+    if delta is None:
+        return None
+    new_index = current_index + delta
+    return new_index if 0 <= new_index < total_images else current_index
+
 @app.route('/navigate/<direction>')
 def navigate(direction):
     """API endpoint to navigate to the next or previous image.
@@ -1094,49 +1925,36 @@ def navigate(direction):
         flask.Response: A JSON response containing the data for the new image,
             identical in format to the response from `/process/<index>`.
     """
-    app.logger.info(f"Navigation request received: {direction}.")
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(f"Navigation request received: {direction}.")
+    if direction not in _NAV_DELTAS:
+        app.logger.warning(f"Invalid navigation direction: {direction}.")
+        return jsonify({'error': 'Invalid navigation direction'}), 400
     source = 'local' # Default source
  
     if session.get('selected_google_drive_folder_id') and session.get('drive_image_files') is not None:
         source = 'drive'
         current_index = session.get('current_drive_image_index', 0)
         total_images = len(session.get('drive_image_files', []))
-        app.logger.debug(f"Drive Navigation: Current index: {current_index}, Total Drive images: {total_images}.")
-        if direction == 'next':
-            new_index = current_index + 1 if current_index < total_images - 1 else current_index
-        elif direction == 'prev':
-            new_index = current_index - 1 if current_index > 0 else current_index
-        else:
-            app.logger.warning(f"Invalid Drive navigation direction: {direction}.")
-            return jsonify({'error': 'Invalid navigation direction'}), 400
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug(f"Drive Navigation: Current index: {current_index}, Total Drive images: {total_images}.")
     elif session.get('is_server_mode') and session.get('server_image_files') is not None:
         source = 'server'
         current_index = session.get('current_server_image_index', 0)
         total_images = len(session.get('server_image_files', []))
-        app.logger.debug(f"Server Navigation: Current index: {current_index}, Total Server images: {total_images}.")
-        if direction == 'next':
-            new_index = current_index + 1 if current_index < total_images - 1 else current_index
-        elif direction == 'prev':
-            new_index = current_index - 1 if current_index > 0 else current_index
-        else:
-            app.logger.warning(f"Invalid Server navigation direction: {direction}.")
-            return jsonify({'error': 'Invalid navigation direction'}), 400
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug(f"Server Navigation: Current index: {current_index}, Total Server images: {total_images}.")
     else: # Local mode
         current_index = session.get('current_index', 0)
-        image_paths = session.get('image_paths', [])
-        total_images = len(image_paths)
-        app.logger.debug(f"Local Navigation: Current index: {current_index}, Total local images: {total_images}.")
-        if direction == 'next':
-            new_index = current_index + 1 if current_index < total_images - 1 else current_index
-        elif direction == 'prev':
-            new_index = current_index - 1 if current_index > 0 else current_index
-        else:
-            app.logger.warning(f"Invalid local navigation direction: {direction}.")
-            return jsonify({'error': 'Invalid navigation direction'}), 400
+        total_images = len(session.get('image_paths', []))
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug(f"Local Navigation: Current index: {current_index}, Total local images: {total_images}.")
+    new_index = _clamp_nav(current_index, total_images, direction)
  
     # If new_index is same as current_index (at a boundary), still fetch data to be consistent.
     # The frontend JS should ideally use 'has_next'/'has_prev' to disable buttons.
-    app.logger.info(f"Navigating to image at index: {new_index} (Source: {source.capitalize()}).")
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(f"Navigating to image at index: {new_index} (Source: {source.capitalize()}).")
     data, status_code = get_processed_image_data(new_index)
     return jsonify(data), status_code
 
@@ -1182,13 +2000,9 @@ def save_processed_image():
     # We need the raw image. We'll have to get the image path and process it again.
     # This is a simplified version of the logic in get_processed_image_data.
 
-    image_path = None
-    temp_image_path = None # For Drive files
-
     try:
         if source == 'drive':
             # This requires downloading the file again.
-            # This logic is duplicated from get_processed_image_data and could be refactored.
             creds_dict = session.get('google_credentials')
             if not creds_dict:
                 return jsonify({'success': False, 'error': 'Google session ended.', 'redirect': url_for('login_google')}), 401
@@ -1202,36 +2016,31 @@ def save_processed_image():
                     'client_secret': credentials.client_secret, 'scopes': credentials.scopes
                 }
 
-            service = build('drive', 'v3', credentials=credentials)
+            # Streamed into memory and decoded there, without a temporary file
             file_id = session['drive_image_files'][index]['id']
-            secure_file_name = secure_filename(filename)
-            temp_image_path = os.path.join(app.config['DRIVE_TEMP_FOLDER'], secure_file_name)
-
-            drive_request = service.files().get_media(fileId=file_id)
-            with io.FileIO(temp_image_path, 'wb') as fh:
-                downloader = googleapiclient.http.MediaIoBaseDownload(fh, drive_request)
-                done = False
-                while not done:
-                    _, done = downloader.next_chunk()
-            image_path = temp_image_path
-
-        elif source == 'server':
-            image_path = os.path.join(app.config['SERVER_IMAGES_FOLDER'], filename)
-        else: # local
-            image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-
-        if not os.path.exists(image_path):
-            app.logger.error(f"Save failed: Image file not found at path: {image_path}")
-            return jsonify({'success': False, 'error': 'Image file not found.'}), 404
-
-        # Load the original image again to save it unmodified
-        original_cv_image = cv2.imread(image_path)
+            image_path = filename # Only used as a label from here on
+            original_cv_image = decode_image_bytes(download_drive_file(credentials, file_id, filename))
+        else:
+            if source == 'server':
+                image_path = os.path.join(app.config['SERVER_IMAGES_FOLDER'], filename)
+            else: # local
+                image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+
+            if not os.path.exists(image_path):
+                app.logger.error(f"Save failed: Image file not found at path: {image_path}")
+                return jsonify({'success': False, 'error': 'Image file not found.'}), 404
+
+            # Load the original image again to save it unmodified
+            original_cv_image = cv2.imread(image_path)
+
         if original_cv_image is None:
             app.logger.error(f"Save failed: Could not read original image from {image_path} to save it.")
             return jsonify({'success': False, 'error': 'Failed to read original image for saving.'}), 500
 
-        # Re-process the image to get the cv2 object
-        processed_cv_image = process_image(image_path, return_image_object=True)
+        # Re-process the image to get the cv2 object, at the full resolution of
+        # the original so that both saved images have the same size
+        processed_cv_image = process_image(image_path, return_image_object=True, cv_image=original_cv_image,
+                                           max_dimension=None)
 
         if processed_cv_image is None:
             app.logger.error(f"Save failed: Processing the image for saving returned None.")
@@ -1280,17 +2089,23 @@ def save_processed_image():
     except Exception as e:
         app.logger.error(f"An unexpected error occurred during save: {e}", exc_info=True)
         return jsonify({'success': False, 'error': 'An unexpected error occurred.'}), 500
-    finally:
-        # Clean up temporary file if it was created
-        if temp_image_path and os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
 
 
+# Pay the detectors' one-time initialization cost at import (i.e. worker boot)
+# rather than on the first request. Set WARM_UP_DETECTORS=0 to skip it.
+if os.environ.get('WARM_UP_DETECTORS', '1') == '1':
+    warm_up_detectors()
+
 if __name__ == '__main__':
+    # The built-in server is for local development only; production runs
+    # `wsgi:application` under Gunicorn (see Dockerfile).
+    if os.environ.get('FLASK_DEV_SERVER') != '1':
+        raise SystemExit("Refusing to start the development server. Set FLASK_DEV_SERVER=1 for local "
+                         "development or run `gunicorn wsgi:application` in production.")
     # Flask's logger is configured above. This basicConfig would be for other modules if needed.
     app.logger.info("Starting Flask application...")
     app.logger.info("Build #42")
     # Use the PORT environment variable provided by Cloud Run, defaulting to 8080 for local dev
     port = int(os.environ.get("PORT", 8080))
     app.logger.info("******* IN DEV ENVIRONMENT USE http://mylocaldomain.com:8080 *****")
-    app.run(debug=False, host='0.0.0.0', port=port)
+    app.run(debug=False, host='0.0.0.0', port=port, threaded=True)
@@ -3,7 +3,10 @@ import os
 import shutil
 import json
 import io
-from flask import session, url_for, Flask
+import base64
+import queue
+import numpy as np
+from flask import session, url_for, Flask, jsonify
 from werkzeug.datastructures import FileStorage
 import google.oauth2.credentials # Used for spec and storing original class
 from googleapiclient.errors import HttpError as RealHttpError # For raising actual HttpError
@@ -15,7 +18,7 @@ import sys
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, PROJECT_ROOT)
 
-from flask_app.app import app, cv_image_to_base64, process_image as app_process_image, extract_folder_id_from_url, get_processed_image_data, CLIENT_SECRETS_FILE, SCOPES, CHARUCO_CONFIG
+from flask_app.app import app, cv_image_to_base64, process_image as app_process_image, extract_folder_id_from_url, get_processed_image_data, process_image_cached, _process_image_cached, store_image, downscale_for_detection, pop_decoded_upload, CLIENT_SECRETS_FILE, SCOPES, CHARUCO_CONFIG
 
 # Dummy client_secret.json content
 DUMMY_CLIENT_SECRET_CONTENT = {
@@ -94,6 +97,10 @@ class AppTestCase(unittest.TestCase): # Inherit from unittest.TestCase
         self.dummy_cv_image.copy = MagicMock(return_value=self.dummy_cv_image)
         mock_cv2_imread.return_value = self.dummy_cv_image
 
+        # Drive HTTP sessions are cached per token; keep one test's mock out of the next
+        from flask_app.app import _DRIVE_HTTP_SESSIONS
+        _DRIVE_HTTP_SESSIONS.clear()
+
     def tearDown(self):
         # Clear session manually after each test
         with app.test_request_context('/'):
@@ -167,7 +174,7 @@ class AppTestCase(unittest.TestCase): # Inherit from unittest.TestCase
     def test_003_upload_files_valid_image(self):
         test_filename = "test.jpg"
         dummy_file = FileStorage(
-            stream=io.BytesIO(b"dummy image data"),
+            stream=io.BytesIO(b"\xff\xd8\xff\xe0dummy image data"), # JPEG magic number
             filename=test_filename,
             content_type="image/jpeg"
         )
@@ -457,19 +464,16 @@ class AppTestCase(unittest.TestCase): # Inherit from unittest.TestCase
         self.assertIsNone(cv_image_to_base64(None))
 
     def test_020_cv_image_to_base64_valid_input(self):
-        # Mocks are already set up at class level for cv2 and PIL
-        dummy_image_array = MagicMock() # Represents a numpy array
-        
+        # A real BGR array, since the image is encoded directly with cv2.imencode
+        dummy_image_array = np.zeros((8, 8, 3), dtype=np.uint8)
+
         result = cv_image_to_base64(dummy_image_array)
 
-        mock_cv2_cvtColor.assert_called_once_with(dummy_image_array, real_cv2.COLOR_BGR2RGB)
-        mock_pil_image_fromarray.assert_called_once_with(dummy_image_array) # Assuming cvtColor returns its input
-        mock_pil_image_instance.save.assert_called_once()
-        args, kwargs = mock_pil_image_instance.save.call_args
-        self.assertIsInstance(args[0], io.BytesIO) # Check buffer type
-        self.assertEqual(kwargs['format'], 'JPEG')
-        self.assertEqual(kwargs['quality'], 85)
+        mock_cv2_cvtColor.assert_not_called() # JPEG is encoded straight from BGR
+        mock_pil_image_fromarray.assert_not_called()
         self.assertTrue(result.startswith('data:image/jpeg;base64,'))
+        jpeg_bytes = base64.b64decode(result.split(',', 1)[1])
+        self.assertTrue(jpeg_bytes.startswith(b'\xff\xd8\xff')) # JPEG SOI marker
 
     @patch('app.cv_image_to_base64', return_value='data:base64_dummy_image_content')
     def test_021_process_image_function_basic_flow(self, mock_cv_to_b64):
@@ -511,12 +515,10 @@ class AppTestCase(unittest.TestCase): # Inherit from unittest.TestCase
         self.assertIsNone(result['processed_image']) # This will also be None as processing starts with original
         self.assertFalse(result['charuco_detected'])
 
-    @patch('app.process_image') # Mock the actual image processing
-    @patch('app.googleapiclient.http.MediaIoBaseDownload') # Target where MediaIoBaseDownload is used in app.py
-    @patch('app.build') # Target where build is used
+    @patch('app.process_cv_image') # Mock the actual image processing
+    @patch('app.google.auth.transport.requests.AuthorizedSession') # Target where AuthorizedSession is used in app.py
     @patch('app.google.oauth2.credentials.Credentials') # Target where Credentials is used
-    @patch('app.io.FileIO') # Target where FileIO is used
-    def test_023_get_processed_image_data_drive_success(self, MockAppFileIO, MockAppCredentials, mock_app_build, MockAppMediaDownload, mock_app_process_image_func):
+    def test_023_get_processed_image_data_drive_success(self, MockAppCredentials, MockAppAuthorizedSession, mock_app_process_image_func):
         # Setup session for Drive mode
         creds_data = {
             'token': 'test_token', 'refresh_token': 'test_refresh_token', 
@@ -532,25 +534,17 @@ class AppTestCase(unittest.TestCase): # Inherit from unittest.TestCase
             sess['selected_google_drive_folder_id'] = 'folder_abc'
             sess['drive_image_files'] = drive_files
 
-        # Mock Drive service and download
-        mock_service = mock_app_build.return_value
-        # mock_service.files().get_media(fileId=file_id)
-        mock_drive_request = MagicMock()
-        mock_service.files.return_value.get_media.return_value = mock_drive_request
-        
-        mock_downloader = MockAppMediaDownload.return_value
-        mock_downloader.next_chunk.side_effect = [(MagicMock(progress=lambda: 1.0), True)] # Simulate download completion
+        # Mock the streamed media download
+        mock_response = MockAppAuthorizedSession.return_value.get.return_value.__enter__.return_value
+        mock_response.status_code = 200
+        mock_response.iter_content.return_value = [b'\xff\xd8\xff', b'jpeg data']
 
         # Mock process_image result
         mock_app_process_image_func.return_value = {'data': 'processed'}
 
-        # Mock os.path.exists and os.remove
-        with patch('os.path.exists', return_value=True), \
-             patch('os.remove') as mock_os_remove:
-            
-            # Call the route, not the helper directly
-            response = self.app.get('/process/0')
-            result_data = json.loads(response.data)
+        # Call the route, not the helper directly
+        response = self.app.get('/process/0')
+        result_data = json.loads(response.data)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(result_data['data'], 'processed') # From mock_app_process_image_func
         self.assertEqual(result_data['current_index'], 0)
@@ -558,16 +552,15 @@ class AppTestCase(unittest.TestCase): # Inherit from unittest.TestCase
         self.assertEqual(result_data['source'], 'drive')
 
         MockAppCredentials.assert_called_once_with(**session_creds_data)
-        mock_app_build.assert_called_once_with('drive', 'v3', credentials=mock_creds_instance)
-        mock_service.files.return_value.get_media.assert_called_once_with(fileId='file_id_123')
-        
-        # Check that FileIO was called to write the downloaded file
-        expected_temp_path = os.path.join(self.test_drive_temp_dir, 'drive_image.jpg')
-        MockAppFileIO.assert_called_once_with(expected_temp_path, 'wb')
-        MockAppMediaDownload.assert_called_once() # Check downloader was created
-        
-        mock_app_process_image_func.assert_called_once_with(expected_temp_path)
-        mock_os_remove.assert_called_once_with(expected_temp_path) # Check temp file deleted
+        MockAppAuthorizedSession.assert_called_once_with(mock_creds_instance)
+        MockAppAuthorizedSession.return_value.get.assert_called_once_with(
+            'https://www.googleapis.com/drive/v3/files/file_id_123?alt=media', stream=True)
+
+        # The file is downloaded into memory; nothing is written to the temp folder
+        self.assertEqual(os.listdir(self.test_drive_temp_dir), [])
+
+        mock_app_process_image_func.assert_called_once()
+        self.assertEqual(mock_app_process_image_func.call_args[0][1], 'drive_image.jpg')
 
         with self.app.session_transaction() as sess:
             self.assertEqual(sess['current_drive_image_index'], 0)
@@ -582,11 +575,9 @@ class AppTestCase(unittest.TestCase): # Inherit from unittest.TestCase
         self.assertEqual(response.status_code, 400)
         self.assertIn('Invalid local image index', result_data['error'])
 
-    # REMOVE: @patch('googleapiclient.errors.HttpError')
-    @patch('app.googleapiclient.http.MediaIoBaseDownload') # Added patch for MediaIoBaseDownload
-    @patch('app.build') # Target where build is used in app.py
+    @patch('app.google.auth.transport.requests.AuthorizedSession') # Target where AuthorizedSession is used in app.py
     @patch('app.google.oauth2.credentials.Credentials') # Target where Credentials is used in app.py
-    def test_025_get_processed_image_data_drive_http_error_404(self, MockAppCredentials, mock_app_build, MockAppMediaDownload): # MockAppMediaDownload is now a param
+    def test_025_get_processed_image_data_drive_http_error_404(self, MockAppCredentials, MockAppAuthorizedSession):
 
         creds_data = {
             'token': 'test_token', 'refresh_token': 'test_refresh_token',
@@ -594,30 +585,18 @@ class AppTestCase(unittest.TestCase): # Inherit from unittest.TestCase
             'client_secret': 'cs', 'scopes': SCOPES
         }
         session_creds_data = self._set_google_session_credentials(**creds_data)
-        mock_creds_instance = self._create_mock_google_credentials(session_creds_data, expired=False) # Keep creds mock for build call assertion
+        mock_creds_instance = self._create_mock_google_credentials(session_creds_data, expired=False) # Keep creds mock for session call assertion
         MockAppCredentials.return_value = mock_creds_instance
 
         drive_files = [{'id': 'file_id_404', 'name': 'notfound.jpg'}]
         with self.app.session_transaction() as sess:
             sess['selected_google_drive_folder_id'] = 'folder_abc'
             sess['drive_image_files'] = drive_files
-        mock_service = mock_app_build.return_value
-
-        # Simulate HttpError from service.files().get_media()
-        # The HttpError needs a `resp` attribute which is a mock response object
-        mock_resp = MagicMock()
-        mock_resp.status = 404
-        mock_resp.reason = "Not Found"
-        # Create a real HttpError instance
-        real_http_error_instance = RealHttpError(mock_resp, b'{"error": {"message": "File not found from API"}}', uri='some_uri')
-
-        # Mock the downloader and its next_chunk method to raise the HttpError
-        mock_drive_request = MagicMock()
-        mock_service.files.return_value.get_media.return_value = mock_drive_request
-        
-        # MockAppMediaDownload is now the mock class from the decorator
-        mock_downloader = MockAppMediaDownload.return_value
-        mock_downloader.next_chunk.side_effect = real_http_error_instance # This will RAISE the error
+        # Simulate a 404 answer to the media download
+        mock_response = MockAppAuthorizedSession.return_value.get.return_value.__enter__.return_value
+        mock_response.status_code = 404
+        mock_response.content = b'{"error": {"message": "File not found from API"}}'
+        mock_response.url = 'some_uri'
 
         # Call the route, not the helper directly
         response = self.app.get('/process/0')
@@ -626,8 +605,8 @@ class AppTestCase(unittest.TestCase): # Inherit from unittest.TestCase
         self.assertIn("not found on Google Drive (404)", result_data['error'])
         self.assertEqual(result_data['filename'], 'notfound.jpg')
         self.assertTrue(result_data['is_api_error'])
-        # Check that build was called with the credentials, even though download failed
-        mock_app_build.assert_called_once_with('drive', 'v3', credentials=mock_creds_instance)
+        # Check that the download used the credentials, even though it failed
+        MockAppAuthorizedSession.assert_called_once_with(mock_creds_instance)
 
     def test_026_413_error_handler(self):
         # This test is a bit indirect for the handler itself.
@@ -712,5 +691,399 @@ class AppTestCase(unittest.TestCase): # Inherit from unittest.TestCase
         with self.app.session_transaction() as sess:
             self.assertEqual(sess.get('current_drive_image_index'), 0) # Reset to 0
 
+    @patch('flask_app.app.process_image')
+    def test_030_process_image_cached_reuses_result(self, mock_process_image_func):
+        mock_process_image_func.return_value = {'processed_image': 'data:proc_base64'}
+        _process_image_cached.cache_clear()
+        image_path = os.path.join(self.test_upload_dir, 'cached.jpg')
+        with open(image_path, 'w') as f: f.write('dummy')
+
+        first = process_image_cached(image_path)
+        first['current_index'] = 0 # Callers add navigation data to the result
+        second = process_image_cached(image_path)
+        mock_process_image_func.assert_called_once_with(image_path, cv_image=None)
+        self.assertNotIn('current_index', second) # Cached entry is not mutated
+
+        # Modifying the file invalidates the cached entry
+        with open(image_path, 'w') as f: f.write('modified dummy')
+        process_image_cached(image_path)
+        self.assertEqual(mock_process_image_func.call_count, 2)
+
+    def test_031_serve_image_from_store(self):
+        jpeg_bytes = b'\xff\xd8\xff dummy jpeg'
+        with app.test_request_context('/'):
+            image_url = store_image(jpeg_bytes)
+            self.assertEqual(store_image(jpeg_bytes), image_url) # Same content, same URL
+            self.assertIsNone(store_image(None))
+
+        response = self.app.get(image_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/jpeg')
+        self.assertEqual(response.data, jpeg_bytes)
+
+    def test_032_serve_image_unknown_token(self):
+        response = self.app.get('/image/does_not_exist.jpg')
+        self.assertEqual(response.status_code, 404)
+
+    def test_033_downscale_for_detection(self):
+        large_image = np.zeros((1000, 3200, 3), dtype=np.uint8)
+        resized, scale = downscale_for_detection(large_image, max_dimension=1600)
+        self.assertEqual(resized.shape, (500, 1600, 3))
+        self.assertAlmostEqual(scale, 0.5)
+
+        small_image = np.zeros((100, 200, 3), dtype=np.uint8)
+        resized, scale = downscale_for_detection(small_image, max_dimension=1600)
+        self.assertIs(resized, small_image) # No resize, no copy
+        self.assertEqual(scale, 1.0)
+
+    @patch('flask_app.app.process_image')
+    def test_034_upload_decodes_first_image_in_memory(self, mock_process_image_func):
+        mock_process_image_func.return_value = {}
+        _process_image_cached.cache_clear()
+        ok, png = real_cv2.imencode('.png', np.zeros((4, 4, 3), dtype=np.uint8))
+        dummy_file = FileStorage(io.BytesIO(png.tobytes()), "hot.png", "image/png")
+        response = self.app.post('/upload', data={'files[]': [dummy_file]}, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+
+        image_path = os.path.join(self.test_upload_dir, 'hot.png')
+        process_image_cached(image_path)
+        _, kwargs = mock_process_image_func.call_args
+        self.assertEqual(kwargs['cv_image'].shape, (4, 4, 3)) # Decoded upload handed over, no imread
+        self.assertIsNone(pop_decoded_upload(image_path)) # Consumed on first use
+
+    @patch('flask_app.app.draw_charuco_detections')
+    @patch('flask_app.app.detect_charuco_board')
+    @patch('flask_app.app.detect_and_draw_qrcodes')
+    def test_035_process_image_runs_detectors_on_clean_image(self, mock_qr_func, mock_charuco_func, mock_draw_func):
+        image = np.zeros((20, 20, 3), dtype=np.uint8)
+        qr_annotated = image.copy()
+        mock_qr_func.return_value = ([qr_annotated], ['QR'], [{}])
+        charuco_ids = np.array([[0], [1]])
+        mock_charuco_func.return_value = (image.copy(), 'corners', charuco_ids, 'markers', 'marker_ids')
+
+        result = app_process_image('dummy.png', cv_image=image)
+
+        self.assertIs(mock_qr_func.call_args[0][0], image)
+        self.assertIs(mock_charuco_func.call_args[0][0], image) # Not the QR-annotated image
+        mock_draw_func.assert_called_once_with(qr_annotated, 'corners', charuco_ids, 'markers', 'marker_ids')
+        self.assertIs(mock_charuco_func.call_args.kwargs['draw'], False) # No throwaway overlay on the gray copy
+        self.assertTrue(result['charuco_detected'])
+        self.assertEqual(result['qr_codes'], ['QR'])
+        self.assertEqual(result['detection_scale'], 1.0) # Small image, not downscaled
+
+    @patch('flask_app.app.encode_preview')
+    @patch('flask_app.app.detect_charuco_board')
+    @patch('flask_app.app.detect_and_draw_qrcodes')
+    def test_036_process_image_no_detections_reuses_original(self, mock_qr_func, mock_charuco_func, mock_encode_func):
+        image = np.zeros((20, 20, 3), dtype=np.uint8)
+        mock_qr_func.return_value = ([], [], [])
+        mock_charuco_func.return_value = (None, None, None, None, None)
+        mock_encode_func.return_value = b'original_jpeg'
+
+        result = app_process_image('dummy.png', cv_image=image)
+
+        mock_encode_func.assert_called_once_with(image) # Original only, no second encode
+        self.assertEqual(result['processed_image'], b'original_jpeg')
+        self.assertIs(app_process_image('dummy.png', return_image_object=True, cv_image=image), image)
+
+    @patch('flask_app.app.release_qr_detector')
+    @patch('flask_app.app.acquire_qr_detector')
+    @patch('flask_app.app.detect_charuco_board')
+    @patch('flask_app.app.detect_and_draw_qrcodes')
+    def test_037_process_image_reuses_shared_detectors(self, mock_qr_func, mock_charuco_func, mock_acquire_qr_detector, mock_release_qr_detector):
+        from flask_app.app import get_charuco_detector
+        shared_detector = get_charuco_detector()
+        self.assertIsNotNone(shared_detector)
+        self.assertIs(get_charuco_detector(), shared_detector) # Built once per board config
+        mock_acquire_qr_detector.return_value = 'shared_qreader'
+        mock_qr_func.return_value = ([], [], [])
+        mock_charuco_func.return_value = (None, None, None, None, None)
+
+        image = np.zeros((20, 20, 3), dtype=np.uint8)
+        app_process_image('dummy.png', cv_image=image)
+        app_process_image('dummy.png', cv_image=image)
+
+        for qr_call in mock_qr_func.call_args_list:
+            self.assertEqual(qr_call.kwargs['detector'], 'shared_qreader')
+        self.assertEqual(mock_release_qr_detector.call_args_list, [call('shared_qreader')] * 2) # Handed back
+        for charuco_call in mock_charuco_func.call_args_list:
+            self.assertIs(charuco_call.kwargs['detector'], shared_detector)
+
+    def test_038_encode_jpeg_prefers_turbojpeg(self):
+        from flask_app.app import encode_jpeg
+        image = np.zeros((8, 8, 3), dtype=np.uint8)
+        mock_turbo = MagicMock()
+        mock_turbo.encode.return_value = b'turbo_jpeg'
+        with patch('flask_app.app._TURBO_JPEG', mock_turbo), patch('flask_app.app.TJPF_BGR', 0, create=True), \
+                patch('flask_app.app.TJFLAG_PROGRESSIVE', 0x4000, create=True):
+            self.assertEqual(encode_jpeg(image), b'turbo_jpeg')
+            self.assertIs(mock_turbo.encode.call_args[0][0], image) # BGR passed straight through
+            encode_jpeg(image, progressive=True)
+            self.assertEqual(mock_turbo.encode.call_args.kwargs['flags'], 0x4000)
+        with patch('flask_app.app._TURBO_JPEG', None):
+            self.assertTrue(encode_jpeg(image).startswith(b'\xff\xd8')) # cv2.imencode fallback
+            progressive_jpeg = encode_jpeg(np.random.randint(0, 256, (64, 64, 3), dtype=np.uint8), progressive=True)
+            self.assertIn(b'\xff\xc2', progressive_jpeg) # SOF2: progressive DCT
+
+    def test_039_encode_preview_limits_size(self):
+        from flask_app.app import encode_preview
+        large_image = np.zeros((1500, 3000, 3), dtype=np.uint8)
+        preview = real_cv2.imdecode(np.frombuffer(encode_preview(large_image, max_dimension=1024), np.uint8), real_cv2.IMREAD_COLOR)
+        self.assertEqual(preview.shape, (512, 1024, 3))
+
+        small_image = np.zeros((100, 200, 3), dtype=np.uint8)
+        preview = real_cv2.imdecode(np.frombuffer(encode_preview(small_image, max_dimension=1024), np.uint8), real_cv2.IMREAD_COLOR)
+        self.assertEqual(preview.shape, (100, 200, 3)) # Never upscaled
+        self.assertIsNone(encode_preview(None))
+
+    def test_040_serve_image_etag_not_modified(self):
+        jpeg_bytes = b'\xff\xd8\xff etag jpeg'
+        with app.test_request_context('/'):
+            image_url = store_image(jpeg_bytes)
+
+        response = self.app.get(image_url)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertTrue(image_url.endswith('.jpg'))
+        self.assertIn('max-age=600', response.headers['Cache-Control'])
+        self.assertIn('immutable', response.headers['Cache-Control'])
+
+        response = self.app.get(image_url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_041_upload_rejects_non_image_content(self):
+        dummy_file = FileStorage(io.BytesIO(b"not really a jpeg"), "fake.jpg", "image/jpeg")
+        response = self.app.post('/upload', data={'files[]': [dummy_file]}, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['rejected'], ['fake.jpg'])
+        self.assertFalse(os.path.exists(os.path.join(self.test_upload_dir, 'fake.jpg')))
+
+    def test_042_upload_streams_remaining_files_to_disk(self):
+        first_file = FileStorage(io.BytesIO(b"\xff\xd8\xff first"), "first.jpg", "image/jpeg")
+        second_file = FileStorage(io.BytesIO(b"\x89PNG\r\n\x1a\n second"), "second.png", "image/png")
+        with patch('flask_app.app.shutil.copyfileobj', wraps=shutil.copyfileobj) as mock_copy:
+            response = self.app.post('/upload', data={'files[]': [first_file, second_file]}, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_copy.call_count, 1) # Only the second file is streamed
+        self.assertEqual(mock_copy.call_args[0][2], 1 << 20)
+        with open(os.path.join(self.test_upload_dir, 'second.png'), 'rb') as f:
+            self.assertEqual(f.read(), b"\x89PNG\r\n\x1a\n second")
+
+    @patch('flask_app.app.detect_charuco_board')
+    @patch('flask_app.app.detect_and_draw_qrcodes')
+    def test_043_process_image_charuco_on_grayscale(self, mock_qr_func, mock_charuco_func):
+        mock_qr_func.return_value = ([], [], [])
+        mock_charuco_func.return_value = (None, None, None, None, None)
+        image = np.zeros((20, 20, 3), dtype=np.uint8)
+        app_process_image('dummy.png', cv_image=image)
+        mock_cv2_cvtColor.assert_any_call(image, real_cv2.COLOR_BGR2GRAY)
+        self.assertIs(mock_qr_func.call_args[0][0], image) # QR still gets the color image
+
+    @patch('flask_app.app._download_drive_file_with_credentials')
+    def test_044_drive_prefetch_next_files(self, mock_download_func):
+        from flask_app.app import prefetch_drive_files, get_prefetched_drive_file
+        mock_download_func.side_effect = lambda creds, file_id, name: f'bytes of {file_id}'.encode()
+        creds_dict = {'refresh_token': 'user_a_refresh'}
+        drive_files = [{'id': f'id{i}', 'name': f'img{i}.jpg'} for i in range(5)]
+
+        prefetch_drive_files(creds_dict, drive_files, 0)
+        self.assertEqual(get_prefetched_drive_file(creds_dict, 'id1'), b'bytes of id1')
+        self.assertEqual(get_prefetched_drive_file(creds_dict, 'id2'), b'bytes of id2')
+        self.assertIsNone(get_prefetched_drive_file(creds_dict, 'id3')) # Only two ahead
+        self.assertIsNone(get_prefetched_drive_file({'refresh_token': 'user_b_refresh'}, 'id1')) # Per user
+        self.assertEqual(mock_download_func.call_count, 2)
+
+    @patch('flask_app.app.process_cv_image')
+    def test_045_process_image_bytes_cached_by_content(self, mock_process_cv_image_func):
+        from flask_app.app import process_image_bytes_cached
+        mock_process_cv_image_func.return_value = {'charuco_detected': False}
+        ok, png = real_cv2.imencode('.png', np.full((4, 4, 3), 45, dtype=np.uint8))
+        data = png.tobytes()
+
+        first = process_image_bytes_cached(data, 'a.png')
+        first['current_index'] = 3 # Callers mutate their copy
+        second = process_image_bytes_cached(bytes(data), 'renamed.png')
+        self.assertEqual(mock_process_cv_image_func.call_count, 1) # Same bytes, cached
+        self.assertNotIn('current_index', second)
+
+        with patch.dict(CHARUCO_CONFIG, {'SQUARES_X': 7}):
+            process_image_bytes_cached(data, 'a.png')
+        self.assertEqual(mock_process_cv_image_func.call_count, 2) # Config is part of the key
+
+    @patch('flask_app.app.build')
+    def test_046_drive_service_cached_per_token(self, mock_build_func):
+        from flask_app.app import get_drive_service
+        mock_build_func.side_effect = lambda *args, **kwargs: MagicMock()
+        creds_a = MagicMock(token='token_046_a')
+        creds_b = MagicMock(token='token_046_b')
+
+        service = get_drive_service(creds_a)
+        self.assertIs(get_drive_service(creds_a), service)
+        self.assertIsNot(get_drive_service(creds_b), service)
+        self.assertEqual(mock_build_func.call_count, 2)
+        self.assertTrue(mock_build_func.call_args.kwargs['static_discovery'])
+
+    def test_047_json_responses_use_orjson_provider(self):
+        from flask_app import app as app_module
+        if app_module.orjson is None:
+            self.skipTest('orjson not installed')
+        self.assertIsInstance(app.json, app_module.OrjsonProvider)
+        with app.test_request_context('/'):
+            response = jsonify({'qr_codes': ['é'], 1: True})
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(response.get_json(), {'qr_codes': ['é'], '1': True})
+        self.assertEqual(app.json.dumps({'value': object()}, default=lambda o: 'custom'), '{"value":"custom"}')
+
+    @patch('flask_app.app.google.auth.transport.requests.AuthorizedSession')
+    def test_048_drive_downloads_reuse_http_session(self, MockAuthorizedSession):
+        from flask_app.app import download_drive_file
+        mock_response = MockAuthorizedSession.return_value.get.return_value.__enter__.return_value
+        mock_response.status_code = 200
+        mock_response.iter_content.side_effect = lambda chunk_size: iter([b'\xff\xd8', b'\xff'])
+        creds = MagicMock(token='token_048')
+
+        self.assertEqual(download_drive_file(creds, 'id1', 'a.jpg'), b'\xff\xd8\xff')
+        self.assertEqual(download_drive_file(creds, 'id2', 'b.jpg'), b'\xff\xd8\xff')
+        MockAuthorizedSession.assert_called_once_with(creds) # One pooled session per token
+        self.assertEqual(MockAuthorizedSession.return_value.get.call_count, 2)
+
+    @patch('flask_app.app._UPLOAD_PRECOMPUTE_EXECUTOR')
+    def test_049_upload_precomputes_following_images(self, mock_executor):
+        files = [FileStorage(io.BytesIO(b"\xff\xd8\xff " + str(i).encode()), f"batch{i}.jpg", "image/jpeg") for i in range(4)]
+        with patch('flask_app.app.UPLOAD_PRECOMPUTE_COUNT', 2):
+            response = self.app.post('/upload', data={'files[]': files}, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        queued_paths = [c.args[1] for c in mock_executor.submit.call_args_list]
+        self.assertEqual(queued_paths, [os.path.join(self.test_upload_dir, 'batch1.jpg'),
+                                        os.path.join(self.test_upload_dir, 'batch2.jpg')])
+
+    @patch('flask_app.app.get_processed_image_data')
+    def test_050_navigate_clamps_index_and_rejects_bad_direction(self, mock_get_processed_image_data):
+        mock_get_processed_image_data.return_value = ({'current_index': 1}, 200)
+        with self.app.session_transaction() as sess:
+            sess['image_paths'] = ['img1.jpg', 'img2.jpg']
+            sess['current_index'] = 1
+
+        response = self.app.get('/navigate/next') # Already at the last image
+        self.assertEqual(response.status_code, 200)
+        mock_get_processed_image_data.assert_called_with(1)
+
+        response = self.app.get('/navigate/sideways')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(mock_get_processed_image_data.call_count, 1)
+
+        from flask_app.app import _clamp_nav
+        self.assertEqual(_clamp_nav(0, 3, 'next'), 1)
+        self.assertEqual(_clamp_nav(0, 3, 'prev'), 0)
+        self.assertEqual(_clamp_nav(0, 0, 'next'), 0) # No images: index unchanged
+        self.assertIsNone(_clamp_nav(0, 3, 'up'))
+
+    @patch('flask_app.app._QR_DETECTOR_POOL', new_callable=queue.SimpleQueue)
+    @patch('flask_app.app.QReader')
+    def test_051_qr_detectors_pooled_not_shared(self, MockQReader, mock_pool):
+        from flask_app.app import acquire_qr_detector, release_qr_detector
+        MockQReader.side_effect = lambda: MagicMock()
+
+        first = acquire_qr_detector()
+        second = acquire_qr_detector() # First one busy: a second instance is loaded
+        self.assertIsNot(first, second)
+        release_qr_detector(first)
+        self.assertIs(acquire_qr_detector(), first) # Idle instances are reused
+        self.assertEqual(MockQReader.call_count, 2)
+
+    @patch('flask_app.app.detect_charuco_board')
+    @patch('flask_app.app.detect_and_draw_qrcodes')
+    def test_052_detection_threads(self, mock_qr_func, mock_charuco_func):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from flask_app import app as app_module
+        detection_threads = {}
+
+        def detect_qr(*args, **kwargs):
+            detection_threads['qr'] = threading.current_thread()
+            return [], [], []
+
+        def detect_charuco(*args, **kwargs):
+            detection_threads['charuco'] = threading.current_thread()
+            return None, None, None, None, None
+
+        mock_qr_func.side_effect = detect_qr
+        mock_charuco_func.side_effect = detect_charuco
+        image = np.zeros((20, 20, 3), dtype=np.uint8)
+
+        app_process_image('dummy.png', cv_image=image)
+        self.assertIs(detection_threads['charuco'], threading.current_thread()) # ChArUco in the request thread
+        self.assertTrue(detection_threads['qr'].name.startswith('detection')) # QR on the detection pool
+
+        detection_threads.clear()
+        with patch('flask_app.app._DETECTION_EXECUTOR') as mock_executor, \
+                ThreadPoolExecutor(max_workers=1, initializer=app_module._run_detections_inline) as background:
+            background.submit(app_process_image, 'dummy.png', cv_image=image).result()
+        mock_executor.submit.assert_not_called() # Background work stays off the detection pool
+        self.assertIs(detection_threads['qr'], detection_threads['charuco'])
+
+    @patch('flask_app.app.draw_charuco_detections')
+    @patch('flask_app.app.detect_charuco_board')
+    @patch('flask_app.app.detect_and_draw_qrcodes')
+    def test_053_process_image_full_resolution_for_saving(self, mock_qr_func, mock_charuco_func, mock_draw_func):
+        mock_qr_func.return_value = ([], [], [])
+        mock_charuco_func.return_value = ('gray', 'corners', np.array([[0]]), 'markers', 'marker_ids')
+        large_image = np.zeros((2000, 3000, 3), dtype=np.uint8)
+
+        processed = app_process_image('large.png', return_image_object=True, cv_image=large_image, max_dimension=None)
+        self.assertEqual(processed.shape, large_image.shape) # Not downscaled
+        self.assertIsNot(processed, large_image) # Drawn on a copy
+        self.assertIs(mock_qr_func.call_args[0][0], large_image)
+
+        processed = app_process_image('large.png', return_image_object=True, cv_image=large_image)
+        self.assertEqual(max(processed.shape[:2]), 1600) # Default: downscaled for detection
+
+
+    @patch('flask_app.app.cv2.imwrite', return_value=True)
+    @patch('flask_app.app.process_image')
+    @patch('flask_app.app.download_drive_file', return_value=b'jpeg bytes')
+    @patch('flask_app.app.decode_image_bytes')
+    @patch('flask_app.app.google.oauth2.credentials.Credentials')
+    def test_054_save_drive_image_decoded_in_memory(self, MockAppCredentials, mock_decode, mock_download,
+                                                   mock_process_image_func, mock_imwrite):
+        creds_data = self._set_google_session_credentials()
+        mock_creds = self._create_mock_google_credentials(creds_data)
+        MockAppCredentials.return_value = mock_creds
+        image = np.zeros((30, 40, 3), dtype=np.uint8)
+        mock_decode.return_value = image
+        mock_process_image_func.return_value = image.copy()
+        with self.app.session_transaction() as sess:
+            sess['selected_google_drive_folder_id'] = 'folder_id'
+            sess['drive_image_files'] = [{'id': 'file_id', 'name': 'drive.jpg'}]
+            sess['current_drive_image_index'] = 0
+
+        save_dir = tempfile.mkdtemp(prefix="flask_test_save_")
+        try:
+            with patch.dict(app.config, {'SERVER_IMAGES_FOLDER': save_dir}):
+                response = self.app.post('/save_processed_image')
+        finally:
+            shutil.rmtree(save_dir)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.data)['success'])
+        mock_download.assert_called_once_with(mock_creds, 'file_id', 'drive.jpg')
+        mock_decode.assert_called_once_with(b'jpeg bytes')
+        self.assertIs(mock_process_image_func.call_args.kwargs['cv_image'], image)
+        self.assertEqual(os.listdir(self.test_drive_temp_dir), []) # No temporary download left behind
+
+
+    @patch('flask_app.app.google.auth.transport.requests.AuthorizedSession')
+    def test_055_evicted_http_session_not_closed(self, MockAuthorizedSession):
+        from flask_app.app import get_drive_http_session
+        first_session, second_session = MagicMock(name='first'), MagicMock(name='second')
+        MockAuthorizedSession.side_effect = [first_session, second_session]
+        with patch('flask_app.app.DRIVE_SERVICE_CACHE_SIZE', 1):
+            self.assertIs(get_drive_http_session(MagicMock(token='token_a')), first_session)
+            self.assertIs(get_drive_http_session(MagicMock(token='token_b')), second_session)
+        first_session.close.assert_not_called() # A download may still be streaming through it
+
+
 if __name__ == '__main__':
-    unittest.main(argv=['first-arg-is-ignored'], exit=False)
\ No newline at end of file
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
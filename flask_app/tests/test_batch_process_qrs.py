@@ -0,0 +1,111 @@
+from unittest.mock import patch, MagicMock
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import numpy as np
+import cv2
+
+# batch_process_qrs.py is a script importing its neighbours as top-level modules
+UTILS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+sys.path.insert(0, UTILS_DIR)
+
+try:
+    import batch_process_qrs
+except ImportError:
+    # QR detection (detect_and_draw_qr, which needs qreader) is mocked in these tests
+    with patch.dict(sys.modules, {'detect_and_draw_qr': MagicMock()}):
+        import batch_process_qrs
+from charuco_detector import CharucoPipeline
+
+TEST_IMAGES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'test_images'))
+PHOTO_NAME = 'IMG_20250521_185417301.jpg'
+
+
+class BatchProcessQrsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix="batch_test_")
+        self.pipeline = CharucoPipeline(*batch_process_qrs.BOARD_PARAMS, detect_max_dimension=batch_process_qrs.DETECT_MAX_DIMENSION,
+                                        detector_params=batch_process_qrs.DETECTOR_PARAMS, refine=batch_process_qrs.REFINE_CORNERS,
+                                        min_stddev=batch_process_qrs.MIN_STDDEV)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write_photo(self, name):
+        """Saves the test photo into the test directory, in the format of `name`."""
+        path = os.path.join(self.test_dir, name)
+        cv2.imwrite(path, cv2.imread(os.path.join(TEST_IMAGES_DIR, PHOTO_NAME)))
+        return path
+
+    def _process(self, image_path, lossless):
+        """Runs `_process_one` on an image with two QR codes found, and returns
+        the output paths and whether each was written."""
+        image = cv2.imread(image_path)
+        crops = [np.full((50, 50, 3), 255, dtype=np.uint8), np.zeros((60, 60, 3), dtype=np.uint8)]
+        with patch.object(batch_process_qrs, '_pipeline', self.pipeline), \
+                patch.object(batch_process_qrs, 'detect_and_draw_qrcodes', return_value=([image] + crops, [], [])) as mock_qr, \
+                ThreadPoolExecutor(max_workers=2) as writer:
+            writes = batch_process_qrs._process_one(image_path, image, writer, lossless)
+            results = [(output_path, write.result()) for output_path, write in writes]
+        self.assertIs(mock_qr.call_args[0][0], image) # QR codes are searched on the ChArUco overlay
+        return results
+
+    def test_001_generated_images_skipped(self):
+        names = ['IMG_1.jpg', 'IMG_1_qr_all.jpg', 'IMG_1_qr_1.jpg', 'IMG_1_qr_12.PNG', 'IMG_1_charuco.png',
+                 'IMG_2.JPEG', 'IMG_2_qr_all.tif', 'qr_1.png', 'IMG_3_qr_allx.jpg', 'notes.txt']
+        for name in names:
+            open(os.path.join(self.test_dir, name), 'wb').close()
+        os.mkdir(os.path.join(self.test_dir, 'folder.jpg'))
+
+        found = sorted(os.path.basename(path) for path in batch_process_qrs._iter_image_paths(self.test_dir))
+        self.assertEqual(found, ['IMG_1.jpg', 'IMG_2.JPEG', 'IMG_3_qr_allx.jpg', 'qr_1.png'])
+        self.assertTrue(batch_process_qrs.GENERATED_IMAGE_NAME_RE.search('photo_QR_ALL.JPG'))
+        self.assertFalse(batch_process_qrs.GENERATED_IMAGE_NAME_RE.search('photo_qr_.jpg'))
+
+    def test_002_jpeg_output_naming(self):
+        image_path = self._write_photo('photo.png')
+        results = self._process(image_path, lossless=False)
+
+        root = os.path.join(self.test_dir, 'photo')
+        self.assertEqual(results, [(f"{root}_qr_all.jpg", True), (f"{root}_qr_1.jpg", True), (f"{root}_qr_2.jpg", True)])
+        for output_path, _ in results:
+            with open(output_path, 'rb') as f:
+                self.assertEqual(f.read(2), b'\xff\xd8') # JPEG, whatever the input format
+        self.assertEqual(cv2.imread(f"{root}_qr_all.jpg").shape, cv2.imread(image_path).shape)
+
+    def test_003_lossless_output_naming(self):
+        image_path = self._write_photo('photo.png')
+        results = self._process(image_path, lossless=True)
+
+        root = os.path.join(self.test_dir, 'photo')
+        self.assertEqual(results, [(f"{root}_qr_all.png", True), (f"{root}_qr_1.png", True), (f"{root}_qr_2.png", True)])
+        # Saved losslessly in the input format
+        np.testing.assert_array_equal(cv2.imread(f"{root}_qr_2.png"), np.zeros((60, 60, 3), dtype=np.uint8))
+        # ...and skipped when the directory is processed again
+        found = [os.path.basename(path) for path in batch_process_qrs._iter_image_paths(self.test_dir)]
+        self.assertEqual(found, ['photo.png'])
+
+    def test_004_charuco_drawn_before_qr_detection(self):
+        image_path = self._write_photo('photo.jpg')
+        original = cv2.imread(image_path)
+        image = original.copy()
+        with patch.object(batch_process_qrs, '_pipeline', self.pipeline), \
+                patch.object(batch_process_qrs, 'detect_and_draw_qrcodes', return_value=([], [], [])), \
+                ThreadPoolExecutor(max_workers=1) as writer:
+            self.assertEqual(batch_process_qrs._process_one(image_path, image, writer), []) # Nothing to save
+        self.assertFalse(np.array_equal(image, original)) # Board drawn in place
+
+    def test_005_unreadable_image(self):
+        with patch.object(batch_process_qrs, '_pipeline', self.pipeline), \
+                patch.object(batch_process_qrs, 'detect_and_draw_qrcodes') as mock_qr, \
+                ThreadPoolExecutor(max_workers=1) as writer:
+            self.assertEqual(batch_process_qrs._process_one('missing.jpg', None, writer), [])
+        mock_qr.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
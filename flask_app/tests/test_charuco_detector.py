@@ -0,0 +1,164 @@
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import unittest
+import numpy as np
+import cv2
+
+# charuco_detector.py is also run as a script, so it is imported the way the
+# scripts next to it import it
+UTILS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+sys.path.insert(0, UTILS_DIR)
+
+from charuco_detector import CharucoPipeline, create_charuco_detector, detect_charuco_board, detect_many, _to_full_resolution
+
+TEST_IMAGES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'test_images'))
+PHOTO_PATHS = [os.path.join(TEST_IMAGES_DIR, name) for name in ('IMG_20250521_184547226.jpg', 'IMG_20250521_185417301.jpg')]
+GENERATED_BOARD_PATH = os.path.join(TEST_IMAGES_DIR, 'charuco_5x5_12markers_5cm.png')
+
+# The board of the test images: 5x5 squares, 5 cm wide, 7 mm markers
+BOARD_PARAMS = (5, 5, 10.0, 7.0, 'DICT_4X4_100')
+ALL_CORNER_IDS = list(range(16)) # (5 - 1) x (5 - 1) inner corners
+ALL_MARKER_IDS = list(range(12))
+
+
+def _sorted_ids(ids):
+    return sorted(np.ravel(ids).tolist()) if ids is not None else []
+
+def _corners_by_id(charucoCorners, charucoIds):
+    return dict(zip(np.ravel(charucoIds).tolist(), np.asarray(charucoCorners).reshape(-1, 2)))
+
+
+class CharucoDetectorTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.photos = [cv2.imread(path, cv2.IMREAD_GRAYSCALE) for path in PHOTO_PATHS]
+        # Full-resolution detections, the reference for the downscaled ones
+        cls.reference_corners = []
+        for gray in cls.photos:
+            charucoCorners, charucoIds, _, _ = CharucoPipeline(*BOARD_PARAMS).detect(gray)
+            cls.reference_corners.append(_corners_by_id(charucoCorners, charucoIds))
+
+    def _rotated_board(self):
+        """Returns a rendered board, rotated off the pixel grid, and the exact
+        positions of its ChArUco corners by id."""
+        detector = create_charuco_detector(*BOARD_PARAMS)
+        board_image = detector.getBoard().generateImage((1000, 1000), marginSize=100)
+        transform = cv2.getRotationMatrix2D((500, 500), 7, 1.0)
+        transform[:, 2] += (0.37, -0.21) # Sub-pixel shift
+        image = cv2.warpAffine(board_image, transform, (1000, 1000), flags=cv2.INTER_CUBIC, borderValue=255)
+        square = 160 # (1000 - 2 * 100) / 5
+        corners = {corner_id: transform @ (100 + square * (corner_id % 4 + 1) - 0.5, 100 + square * (corner_id // 4 + 1) - 0.5, 1)
+                   for corner_id in ALL_CORNER_IDS}
+        return detector, image, corners
+
+    def test_001_full_resolution_photos(self):
+        for path, gray in zip(PHOTO_PATHS, self.photos):
+            _, charucoIds, _, markerIds = CharucoPipeline(*BOARD_PARAMS).detect(gray)
+            self.assertEqual(_sorted_ids(charucoIds), ALL_CORNER_IDS, path)
+            self.assertEqual(_sorted_ids(markerIds), ALL_MARKER_IDS, path)
+
+    def test_002_pipeline_downscaled_photos(self):
+        # The batch script's setting: 4160x3120 photos are searched at 1600x1200
+        pipeline = CharucoPipeline(*BOARD_PARAMS, detect_max_dimension=1600, detector_params={'adaptiveThreshWinSizeMax': 13})
+        for path, reference in zip(PHOTO_PATHS, self.reference_corners):
+            charucoCorners, charucoIds, markerCorners, markerIds = pipeline.detect(path)
+            self.assertEqual(_sorted_ids(charucoIds), ALL_CORNER_IDS, path)
+            self.assertEqual(_sorted_ids(markerIds), ALL_MARKER_IDS, path)
+            # Corners and markers are in full-resolution coordinates
+            for corner_id, corner in _corners_by_id(charucoCorners, charucoIds).items():
+                self.assertLess(np.linalg.norm(corner - reference[corner_id]), 1.0, f"{path}: corner {corner_id}")
+            self.assertGreater(np.asarray(markerCorners).max(), 1600)
+
+    def test_003_detect_charuco_board_downscale(self):
+        # Markers are ~58 px wide in the photos; downscale=2 keeps them well above 20 px
+        for path, reference in zip(PHOTO_PATHS, self.reference_corners):
+            _, charucoCorners, charucoIds, _, markerIds = detect_charuco_board(path, *BOARD_PARAMS, draw=False, downscale=2)
+            self.assertEqual(_sorted_ids(charucoIds), ALL_CORNER_IDS, path)
+            self.assertEqual(_sorted_ids(markerIds), ALL_MARKER_IDS, path)
+            for corner_id, corner in _corners_by_id(charucoCorners, charucoIds).items():
+                self.assertLess(np.linalg.norm(corner - reference[corner_id]), 1.0, f"{path}: corner {corner_id}")
+
+    def test_004_to_full_resolution_refinement(self):
+        detector, image, true_corners = self._rotated_board()
+        scale = 0.25
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        small_detections = detector.detectBoard(small)
+        self.assertEqual(_sorted_ids(small_detections[1]), ALL_CORNER_IDS)
+
+        errors = {}
+        for refine in (False, True):
+            charucoCorners, charucoIds, markerCorners, markerIds = _to_full_resolution(image, scale, *small_detections, refine=refine)
+            errors[refine] = max(np.linalg.norm(corner - true_corners[corner_id])
+                                 for corner_id, corner in _corners_by_id(charucoCorners, charucoIds).items())
+            self.assertIs(markerIds, small_detections[3])
+            # Pixel centers are aligned: x on the small image is (x + 0.5) / scale - 0.5 on the original
+            np.testing.assert_allclose(markerCorners[0], (small_detections[2][0] + 0.5) / scale - 0.5)
+        self.assertLess(errors[True], 0.15)
+        self.assertLess(errors[True], errors[False]) # Refinement recovers accuracy lost to downscaling
+
+    def test_005_to_full_resolution_no_detections(self):
+        image = np.zeros((40, 40), dtype=np.uint8)
+        self.assertEqual(_to_full_resolution(image, 0.5, None, None, (), None), (None, None, (), None))
+
+    def test_006_min_stddev_skips_uniform_images(self):
+        pipeline = CharucoPipeline(*BOARD_PARAMS, min_stddev=5)
+        pipeline.detector = MagicMock(wraps=pipeline.detector)
+
+        blank = np.full((480, 640), 200, dtype=np.uint8)
+        self.assertEqual(pipeline.detect(blank), (None, None, (), None))
+        pipeline.detector.detectBoard.assert_not_called()
+
+        # The photos (a small board on a white sheet) deviate by about 25
+        _, charucoIds, _, _ = pipeline.detect(self.photos[0])
+        pipeline.detector.detectBoard.assert_called_once()
+        self.assertEqual(_sorted_ids(charucoIds), ALL_CORNER_IDS)
+
+    def test_007_opencl_fallback(self):
+        gray = cv2.imread(GENERATED_BOARD_PATH, cv2.IMREAD_GRAYSCALE)
+        with patch('cv2.ocl.haveOpenCL', return_value=False):
+            pipeline = CharucoPipeline(*BOARD_PARAMS, use_opencl=True)
+        self.assertFalse(pipeline.use_opencl) # No OpenCL: the CPU path only
+        self.assertEqual(_sorted_ids(pipeline.detect(gray)[1]), ALL_CORNER_IDS)
+        self.assertIsNone(pipeline._opencl_faster)
+
+        with patch('cv2.ocl.haveOpenCL', return_value=True):
+            pipeline = CharucoPipeline(*BOARD_PARAMS, use_opencl=True)
+        self.assertTrue(pipeline.use_opencl)
+        # cv2.UMat works without an OpenCL device, on the CPU
+        self.assertEqual(_sorted_ids(pipeline._detect_board_opencl(gray)[1]), ALL_CORNER_IDS)
+
+        # The first image is detected both ways and the faster path is kept
+        with patch('charuco_detector.time.perf_counter', side_effect=[0.0, 2.0, 2.0, 3.0]):
+            charucoCorners, charucoIds, markerCorners, markerIds = pipeline.detect(gray)
+        self.assertFalse(pipeline._opencl_faster) # OpenCL 2 s, CPU 1 s
+        self.assertIsInstance(charucoCorners, np.ndarray)
+        self.assertEqual(_sorted_ids(charucoIds), ALL_CORNER_IDS)
+        with patch.object(pipeline, '_detect_board_opencl') as mock_opencl:
+            self.assertEqual(_sorted_ids(pipeline.detect(gray)[1]), ALL_CORNER_IDS)
+        mock_opencl.assert_not_called()
+
+    def test_008_detect_many(self):
+        previous_threads = cv2.getNumThreads()
+        cv2.setNumThreads(3)
+        try:
+            results = detect_many(PHOTO_PATHS + [GENERATED_BOARD_PATH], *BOARD_PARAMS, max_workers=2, detect_max_dimension=1600)
+            path, (_, charucoIds, _, _) = next(results)
+            self.assertEqual(path, PHOTO_PATHS[0])
+            self.assertEqual(_sorted_ids(charucoIds), ALL_CORNER_IDS)
+
+            # An overlapping run, stopped early
+            other_results = detect_many(PHOTO_PATHS, *BOARD_PARAMS, max_workers=2)
+            next(other_results)
+            remaining = list(results)
+            other_results.close()
+            self.assertEqual([path for path, _ in remaining], PHOTO_PATHS[1:] + [GENERATED_BOARD_PATH])
+            for path, (_, charucoIds, _, _) in remaining:
+                self.assertEqual(_sorted_ids(charucoIds), ALL_CORNER_IDS, path)
+            self.assertEqual(cv2.getNumThreads(), 3) # Process-wide setting left to the caller
+        finally:
+            cv2.setNumThreads(previous_threads)
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
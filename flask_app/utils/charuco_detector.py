@@ -17,32 +17,474 @@ Requirements:
 
 Usage:
 1. Ensure you have an image containing the ChArUco board you want to detect.
-2. Modify the configuration variables in the `if __name__ == "__main__":` block
-   to match the parameters of your ChArUco board and specify the path to your image.
-3. Run the script: `python charuco_detector.py`
-4. A window will display the image with detected markers and corners highlighted.
-   Press any key to close the window.
-5. Optionally, the script can save the resulting image with detections.
+2. Run the script with the path to your image and, if they differ from the
+   defaults, the parameters of your ChArUco board:
+   `python charuco_detector.py IMAGE --squares-x 5 --squares-y 5 --board-width-cm 5 --marker-length-mm 7 --dictionary DICT_4X4_100`
+   (see `python charuco_detector.py --help`).
+3. A window will display the image with detected markers and corners highlighted
+   (unless `--no-display` is given). Press any key to close the window.
+4. The resulting image with detections is saved to `detected_charuco_board.png`.
 
 Note: For accurate pose estimation, camera calibration is required. This script
 primarily focuses on detection and visualization.
+
+Note: If detection hangs or crashes in OpenCV's parallel code (reported on some
+AMD CPUs), limit OpenCV's threads with the `OPENCV_FOR_THREADS_NUM=1`
+environment variable (`--threads 1` here). The limit applies to the whole
+process, so it is not changed per call.
 """
 
+import argparse
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import cv2
 import numpy as np
 
-def detect_charuco_board(image_input, squares_x, squares_y, square_length_mm, marker_length_mm, dictionary_name, display=False):
+logger = logging.getLogger(__name__)
+
+# `cv2.aruco.DetectorParameters` overrides enabling the ArUco3 fast detection
+# mode, which searches for marker candidates on a reduced image. It is much
+# faster on images where the markers are large, but misses markers that are
+# small in the frame (e.g. a board a few centimeters wide in a 12 MP photo), so
+# it is opt-in.
+ARUCO3_DETECTOR_PARAMS = {
+    'useAruco3Detection': True,
+    'minSideLengthCanonicalImg': 32,
+    'minMarkerLengthRatioOriginalImg': 0.008,
+}
+
+def load_image(image_path, flags=cv2.IMREAD_COLOR):
+    """
+    Reads an image file and decodes it.
+
+    The file is read with `np.fromfile` and decoded from memory with
+    `cv2.imdecode`, rather than with `cv2.imread`. Reading and decoding are then
+    separate steps that callers can schedule independently (e.g. reading ahead
+    on an I/O thread, or handing the bytes to another decoder), and paths with
+    non-ASCII characters also work on Windows.
+
+    Args:
+        image_path (str): Path to the image file.
+        flags (int): `cv2.imdecode` flags, e.g. `cv2.IMREAD_GRAYSCALE`.
+
+    Returns:
+        numpy.ndarray or None: The decoded image, or None if the file could not
+            be read or decoded.
+    """
+    try:
+        buffer = np.fromfile(image_path, dtype=np.uint8)
+    except OSError:
+        return None
+    if buffer.size == 0:
+        return None
+    return cv2.imdecode(buffer, flags)
+
+# Half size, in pixels, of the square drawn around each detected corner.
+CORNER_MARK_RADIUS = 3
+_CORNER_MARK_OFFSETS = np.array(
+    [[-1, -1], [1, -1], [1, 1], [-1, 1]], dtype=np.int32) * CORNER_MARK_RADIUS
+
+def _corner_marks(points):
+    """Returns an (N, 4, 2) int32 array of small squares centered on `points`."""
+    centers = np.rint(points.reshape(-1, 1, 2)).astype(np.int32)
+    return centers + _CORNER_MARK_OFFSETS
+
+def _draw_ids(img, positions, ids, color):
+    """Draws "id=N" labels, one per row of `positions`."""
+    for (x, y), marker_id in zip(np.rint(positions).astype(np.int32), np.ravel(ids)):
+        cv2.putText(img, f"id={marker_id}", (int(x), int(y)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
+def draw_charuco_detections(img, charucoCorners, charucoIds, markerCorners, markerIds):
+    """
+    Draws detected ChArUco corners and ArUco markers onto an image, in place.
+
+    This is the same drawing performed by `detect_charuco_board`, exposed so that
+    callers which detect on one image can render the result onto another (e.g. an
+    image that already carries other annotations).
+
+    It draws the same marks as `cv2.aruco.drawDetectedCornersCharuco` and
+    `cv2.aruco.drawDetectedMarkers`, but all corner squares and all marker
+    outlines are drawn with one `cv2.polylines` call each, and corners are
+    accepted in either the (N, 1, 2) or the (N, 2) layout (the latter makes
+    `drawDetectedCornersCharuco` fail an assertion in OpenCV 5).
+
+    Args:
+        img (numpy.ndarray): The BGR image to draw on. It is modified in place.
+        charucoCorners (numpy.ndarray or None): Detected ChArUco corners.
+        charucoIds (numpy.ndarray or None): IDs of the detected ChArUco corners.
+        markerCorners (list of numpy.ndarray or None): Detected ArUco marker corners.
+        markerIds (numpy.ndarray or None): IDs of the detected ArUco markers.
+
+    Returns:
+        numpy.ndarray: The same `img`, for convenience.
+    """
+    if markerIds is not None and charucoIds is not None:
+        # Draw the detected ChArUco corners
+        corner_color = (0, 255, 0)
+        points = np.asarray(charucoCorners, dtype=np.float32).reshape(-1, 2)
+        cv2.polylines(img, _corner_marks(points), True, corner_color, 1, cv2.LINE_AA)
+        _draw_ids(img, points + (CORNER_MARK_RADIUS + 2, -CORNER_MARK_RADIUS - 2), charucoIds, corner_color)
+
+        # Draw the individual ArUco markers (optional, as charuco detection is more robust)
+        border_color, first_corner_color = (0, 0, 255), (0, 255, 0)
+        quads = np.asarray(markerCorners, dtype=np.float32).reshape(-1, 4, 2)
+        cv2.polylines(img, np.rint(quads).astype(np.int32), True, border_color)
+        cv2.polylines(img, _corner_marks(quads[:, 0]), True, first_corner_color, 1, cv2.LINE_AA)
+        _draw_ids(img, quads.mean(axis=1), markerIds, border_color)
+    return img
+
+def create_charuco_detector(squares_x, squares_y, square_length_mm, marker_length_mm, dictionary_name, detector_params=None):
+    """
+    Builds a `cv2.aruco.CharucoDetector` for the given board parameters.
+
+    Building the dictionary, board and detector is the same work for every image
+    of a given board, so callers processing many images should build the detector
+    once and pass it to `detect_charuco_board` via its `detector` argument.
+
+    Args:
+        squares_x (int): Number of squares in X direction of the board.
+        squares_y (int): Number of squares in Y direction of the board.
+        square_length_mm (float): Length of a square in millimeters.
+        marker_length_mm (float): Length of a marker in millimeters.
+        dictionary_name (str): Name of the Aruco dictionary used (e.g., "DICT_4X4_50").
+        detector_params (dict, optional): `cv2.aruco.DetectorParameters` attributes
+            to override, e.g. `ARUCO3_DETECTOR_PARAMS` or
+            `{'adaptiveThreshWinSizeMax': 13}` to run fewer thresholding passes.
+
+    Returns:
+        cv2.aruco.CharucoDetector or None: The detector, or None if the dictionary
+            name is not valid.
+    """
+    # Get the ArUco dictionary
+    try:
+        dictionary = cv2.aruco.getPredefinedDictionary(getattr(cv2.aruco, dictionary_name))
+    except AttributeError:
+        logger.error(f"Dictionary '{dictionary_name}' not found. Please check the dictionary name.")
+        return None
+
+    # Create the ChArUco board object (same as in generation)
+    board = cv2.aruco.CharucoBoard((squares_x, squares_y), square_length_mm / 1000.0, marker_length_mm / 1000.0, dictionary)
+    # board = cv2.aruco.CharucoBoard((squares_x, squares_y), 0.01, 0.007, dictionary)
+    
+    # Set legacy pattern for older ChArUco boards
+    # board.setLegacyPattern(True)
+    
+    # --- NEW: Create CharucoParameters and DetectorParameters ---
+    # DetectorParameters for the underlying Aruco detection
+    aruco_params = cv2.aruco.DetectorParameters()
+    for name, value in (detector_params or {}).items():
+        setattr(aruco_params, name, value)
+    # CharucoParameters for the ChArUco interpolation/detection
+    charuco_params = cv2.aruco.CharucoParameters()
+
+    # --- NEW: Pass charuco_params and aruco_params to CharucoDetector ---
+    # The CharucoDetector constructor now expects (board, charucoParams, detectorParams)
+    return cv2.aruco.CharucoDetector(board, charuco_params, aruco_params)
+
+@lru_cache(maxsize=8)
+def _get_detector(squares_x, squares_y, square_length_mm, marker_length_mm, dictionary_name, detector_params_items=()):
+    """
+    Returns a detector for a board configuration, built on first use.
+
+    Building the dictionary, board and detector is repeated work when a caller
+    runs `detect_charuco_board` on many images (e.g. video frames) with the same
+    board, so detectors for the most recent configurations are kept.
+
+    Args:
+        detector_params_items (tuple): The `detector_params` overrides as sorted
+            (name, value) pairs, so that they can be part of the cache key.
+
+    Returns:
+        cv2.aruco.CharucoDetector or None: See `create_charuco_detector`.
+    """
+    return create_charuco_detector(squares_x, squares_y, square_length_mm, marker_length_mm,
+                                   dictionary_name, dict(detector_params_items))
+
+# Window and stop criteria of the sub-pixel refinement of rescaled corners
+SUBPIX_WINDOW = (5, 5)
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+
+def _to_full_resolution(image, scale, charucoCorners, charucoIds, markerCorners, markerIds, refine=True):
+    """
+    Maps corners detected on a downscaled image back onto the original one.
+
+    Pixel centers are aligned, so a coordinate x on the small image maps to
+    (x + 0.5) / scale - 0.5 on the original. With `refine`, the ChArUco corners
+    are then refined with `cv2.cornerSubPix` on the original image, recovering
+    the accuracy lost to downscaling.
+
+    Args:
+        image (numpy.ndarray): The original image, grayscale or BGR.
+        scale (float): The factor the image was downscaled by (< 1).
+        refine (bool): Whether to refine the rescaled ChArUco corners.
+
+    Returns:
+        tuple: (charucoCorners, charucoIds, markerCorners, markerIds) in the
+            coordinates of the original image.
+    """
+    if markerCorners is not None and len(markerCorners) > 0:
+        markerCorners = tuple(((corners + 0.5) / scale - 0.5).astype(np.float32) for corners in markerCorners)
+    if charucoCorners is not None and len(charucoCorners) > 0:
+        charucoCorners = ((charucoCorners + 0.5) / scale - 0.5).astype(np.float32)
+        if refine:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+            cv2.cornerSubPix(gray, charucoCorners, SUBPIX_WINDOW, (-1, -1), SUBPIX_CRITERIA)
+    return charucoCorners, charucoIds, markerCorners, markerIds
+
+def _umat_to_array(umat):
+    """Downloads a detection output from a `cv2.UMat`; None if it is empty."""
+    array = umat.get()
+    return array if array is not None and array.size > 0 else None
+
+class CharucoPipeline:
+    """
+    Holds a ChArUco detector built once for a fixed board configuration.
+
+    The dictionary, board and detector parameters never change for a given
+    board, so batch callers create one pipeline up front and call `detect` for
+    every image instead of rebuilding them per image.
+
+    Attributes:
+        detector (cv2.aruco.CharucoDetector or None): The prebuilt detector, or
+            None if the dictionary name is not valid. It can also be passed to
+            `detect_charuco_board` through its `detector` argument.
+        detect_max_dimension (int or None): Longest image edge, in pixels, that
+            markers are searched at. See `detect`.
+        refine (bool): Whether ChArUco corners found on a downscaled image are
+            refined on the full-resolution one. See `detect`.
+        use_opencl (bool): Whether detection may run on OpenCV's OpenCL backend.
+            See `__init__`.
+        min_stddev (float or None): Images whose gray levels have a lower
+            standard deviation are not searched. See `__init__`.
+
+    The grayscale and downscaled images are written into buffers kept between
+    calls and reallocated only when the image size changes, so a pipeline must
+    not be shared between threads.
+    """
+
+    def __init__(self, squares_x, squares_y, square_length_mm, marker_length_mm, dictionary_name, detect_max_dimension=None, detector_params=None, refine=True, use_opencl=False, min_stddev=None):
+        """
+        Args:
+            squares_x (int): Number of squares in X direction of the board.
+            squares_y (int): Number of squares in Y direction of the board.
+            square_length_mm (float): Length of a square in millimeters.
+            marker_length_mm (float): Length of a marker in millimeters.
+            dictionary_name (str): Name of the Aruco dictionary used (e.g., "DICT_4X4_50").
+            detect_max_dimension (int, optional): If given, larger images are
+                downscaled so that their longest edge is at most this many
+                pixels before detection. None detects at full resolution.
+            detector_params (dict, optional): `cv2.aruco.DetectorParameters`
+                overrides, see `create_charuco_detector`.
+            refine (bool): If False, corners found on a downscaled image are only
+                rescaled, not refined with `cv2.cornerSubPix`. They are then off by
+                up to about half the downscaling factor in pixels, which is fine
+                for drawing detections but not for measurements or calibration.
+            use_opencl (bool): If True and OpenCL is available, images are passed
+                to the detector as `cv2.UMat`, so that OpenCV can run the
+                thresholding on the GPU. Whether that pays off depends on the
+                device and on how much of the marker search falls back to the
+                CPU, so the first image is detected both ways and the faster
+                path is kept for the rest.
+            min_stddev (float, optional): If given, images whose gray levels have
+                a standard deviation below this are reported as having no board
+                without running the detector. A board needs black and white
+                squares, so nearly uniform images (e.g. blank or badly exposed
+                shots) cannot contain one. Keep this low: a small board on a
+                large white sheet only adds a little to the deviation of the
+                whole image.
+        """
+        self.detector = create_charuco_detector(squares_x, squares_y, square_length_mm, marker_length_mm, dictionary_name, detector_params)
+        self.detect_max_dimension = detect_max_dimension
+        self.refine = refine
+        self._buffers = {}
+        self.use_opencl = use_opencl and cv2.ocl.haveOpenCL()
+        # Set by the first detection when use_opencl is True
+        self._opencl_faster = None
+        self.min_stddev = min_stddev
+
+    def detect(self, image_input):
+        """
+        Detects the board in an image, without drawing anything.
+
+        Since nothing is drawn, images given by path are decoded straight to
+        grayscale, which is all the detector uses. This skips decoding the two
+        color planes and the detector's own color-to-gray conversion.
+
+        Marker detection cost is dominated by thresholding and contour search
+        over the whole image, so with `detect_max_dimension` set, large images
+        are searched at reduced size. The corners found are mapped back to
+        full-resolution coordinates and, unless `refine` is False, the ChArUco
+        corners are refined with `cv2.cornerSubPix` on the full-resolution image.
+
+        Args:
+            image_input (str or numpy.ndarray): Path to the image, or the image
+                itself, preferably single-channel grayscale.
+
+        Returns:
+            tuple: (charucoCorners, charucoIds, markerCorners, markerIds), as
+                returned by `cv2.aruco.CharucoDetector.detectBoard`, in the
+                coordinates of the full-resolution image. All None if the
+                detector could not be built or the image could not be loaded,
+                and no detections if the image was skipped for `min_stddev`.
+        """
+        if self.detector is None:
+            return None, None, None, None
+        if isinstance(image_input, str):
+            gray = load_image(image_input, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                logger.error(f"Could not load image from path: {image_input}")
+                return None, None, None, None
+        else:
+            gray = image_input
+
+        longest_edge = max(gray.shape[:2])
+        if not self.detect_max_dimension or longest_edge <= self.detect_max_dimension:
+            return self._detect_board(gray)
+
+        # Convert before downscaling, so only one channel is resized
+        if gray.ndim == 3:
+            gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY, dst=self._buffer('gray', gray.shape[:2]))
+        scale = self.detect_max_dimension / longest_edge
+        height, width = gray.shape
+        small_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        small = cv2.resize(gray, small_size, dst=self._buffer('small', small_size[::-1]), interpolation=cv2.INTER_AREA)
+        charucoCorners, charucoIds, markerCorners, markerIds = self._detect_board(small)
+        return _to_full_resolution(gray, scale, charucoCorners, charucoIds, markerCorners, markerIds, self.refine)
+
+    def _detect_board(self, gray):
+        """Runs `detectBoard` on the CPU or, if enabled and faster, on OpenCL."""
+        if self.min_stddev is not None:
+            stddev = cv2.meanStdDev(gray)[1].max()
+            if stddev < self.min_stddev:
+                logger.debug(f"Skipped ChArUco detection on a low-contrast image (gray level deviation {stddev:.1f}).")
+                return None, None, (), None
+        if not self.use_opencl:
+            return self.detector.detectBoard(gray)
+        if self._opencl_faster is None:
+            start = time.perf_counter()
+            result = self._detect_board_opencl(gray)
+            opencl_time = time.perf_counter() - start
+            start = time.perf_counter()
+            result = self.detector.detectBoard(gray)
+            cpu_time = time.perf_counter() - start
+            self._opencl_faster = opencl_time < cpu_time
+            logger.info(f"ChArUco detection uses {'OpenCL' if self._opencl_faster else 'the CPU'} "
+                        f"(OpenCL {opencl_time * 1000:.0f} ms, CPU {cpu_time * 1000:.0f} ms).")
+            return result
+        if self._opencl_faster:
+            return self._detect_board_opencl(gray)
+        return self.detector.detectBoard(gray)
+
+    def _detect_board_opencl(self, gray):
+        """Runs `detectBoard` on a `cv2.UMat` and returns NumPy arrays, as the CPU path does."""
+        charucoCorners, charucoIds, markerCorners, markerIds = self.detector.detectBoard(cv2.UMat(gray))
+        return (_umat_to_array(charucoCorners), _umat_to_array(charucoIds),
+                tuple(corners.get() for corners in markerCorners), _umat_to_array(markerIds))
+
+    def _buffer(self, name, shape):
+        """Returns the `uint8` buffer `name`, reallocated if its shape differs."""
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, dtype=np.uint8)
+        return buffer
+
+def detect_many(image_paths, squares_x, squares_y, square_length_mm, marker_length_mm, dictionary_name, max_workers=None, **pipeline_options):
+    """
+    Detects the board in many image files, overlapping file reading, decoding
+    and detection.
+
+    Each of `max_workers` threads reads, decodes (to grayscale) and searches one
+    image at a time with its own `CharucoPipeline`. File reads, JPEG decoding
+    and detection all release the GIL, so while one thread waits for the disk
+    the others keep the CPU busy. At most `2 * max_workers` images are in
+    flight, so memory use does not grow with the number of paths, which may be
+    a lazy iterator.
+
+    The images are already processed in parallel, so callers should limit
+    OpenCV's own thread pool, e.g. with `cv2.setNumThreads(1)` in a script or
+    worker process (as `batch_process_qrs.py` does) or the
+    `OPENCV_FOR_THREADS_NUM=1` environment variable. That setting is
+    process-wide, so it is not changed here.
+
+    Args:
+        image_paths (iterable of str): The paths of the images.
+        squares_x, squares_y, square_length_mm, marker_length_mm, dictionary_name:
+            The board parameters, see `CharucoPipeline`.
+        max_workers (int, optional): Number of threads. Defaults to the number
+            of CPUs.
+        **pipeline_options: Further `CharucoPipeline` arguments, e.g.
+            `detect_max_dimension` or `detector_params`.
+
+    Yields:
+        tuple: (path, (charucoCorners, charucoIds, markerCorners, markerIds)) for
+            each path, in order. The detections are those of
+            `CharucoPipeline.detect`.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    local = threading.local()
+
+    def detect(path):
+        # Pipelines reuse buffers between calls, so each thread has its own
+        pipeline = getattr(local, 'pipeline', None)
+        if pipeline is None:
+            pipeline = local.pipeline = CharucoPipeline(
+                squares_x, squares_y, square_length_mm, marker_length_mm, dictionary_name, **pipeline_options)
+        return pipeline.detect(path)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='charuco-detect') as executor:
+        pending = deque()
+        for path in image_paths:
+            if len(pending) >= 2 * max_workers:
+                done_path, future = pending.popleft()
+                yield done_path, future.result()
+            pending.append((path, executor.submit(detect, path)))
+        while pending:
+            done_path, future = pending.popleft()
+            yield done_path, future.result()
+
+def detect_charuco_board(image_input, squares_x, squares_y, square_length_mm, marker_length_mm, dictionary_name, display=False, detector=None, draw_on=None, detector_params=None, inplace=False, draw=True, downscale=1):
     """
     Detects a ChArUco board in an image and draws the detected corners and board.
 
     Args:
         image_input (str or numpy.ndarray): Path to the input image or the image itself (as a NumPy array).
+            A single-channel (grayscale) array is accepted and is the cheapest input,
+            as the detector converts color images to grayscale internally.
         squares_x (int): Number of squares in X direction of the board.
         squares_y (int): Number of squares in Y direction of the board.
         square_length_mm (float): Length of a square in millimeters.
         marker_length_mm (float): Length of a marker in millimeters.
         dictionary_name (str): Name of the Aruco dictionary used (e.g., "DICT_4X4_50").
         display (bool): Whether to display the image with detections.
+        detector (cv2.aruco.CharucoDetector, optional): A prebuilt detector from
+            `create_charuco_detector`. If None, a detector for the board parameters
+            is built on the first call and reused by later calls with the same
+            parameters.
+        draw_on (numpy.ndarray, optional): An image (e.g. the BGR original of a
+            grayscale `image_input`) to draw the detections on, in place. If None,
+            detections are drawn on a copy of an array `image_input`, made only
+            when there is something to draw.
+        detector_params (dict, optional): `cv2.aruco.DetectorParameters` overrides
+            for the detector built from the board parameters (ignored if
+            `detector` is given). Pass `ARUCO3_DETECTOR_PARAMS` to search for
+            markers on a reduced image, which is much faster on large images
+            where the markers are large.
+        inplace (bool): If True, detections are drawn directly on an array
+            `image_input` instead of on a copy. Ignored if `draw_on` is given.
+        draw (bool): If False, nothing is drawn and no copy is made, for callers
+            that only need the detected corners and ids.
+        downscale (float): If greater than 1, markers are searched on the image
+            shrunk by this factor, which is roughly `downscale`² times cheaper.
+            The corners found are mapped back to full-resolution coordinates and
+            the ChArUco corners refined on the full-resolution image. Suited to
+            large images in which the markers stay well above ~20 pixels wide
+            after shrinking.
 
     Note:
         - The function uses `cv2.aruco.CharucoDetector` for detection, which
@@ -52,7 +494,7 @@ def detect_charuco_board(image_input, squares_x, squares_y, square_length_mm, ma
 
     Returns:
         tuple or (None, None, None, None, None):
-            - img (numpy.ndarray or None): The image with detections drawn. None if an error occurs (e.g., image not loaded).
+            - img (numpy.ndarray or None): The image with detections drawn (`draw_on` if given). If nothing was detected or drawn, or with `inplace`, this is the input array itself, not a copy. None if an error occurs (e.g., image not loaded).
             - charucoCorners (numpy.ndarray or None): Array of detected ChArUco corners. None if no corners are found or an error occurs.
             - charucoIds (numpy.ndarray or None): Array of IDs for the detected ChArUco corners. None if no corners are found or an error occurs.
             - markerCorners (list of numpy.ndarray or None): List of detected ArUco marker corners. None if no markers are found or an error occurs.
@@ -61,55 +503,49 @@ def detect_charuco_board(image_input, squares_x, squares_y, square_length_mm, ma
 
     # Load the image
     if isinstance(image_input, str):
-        img = cv2.imread(image_input)
+        img = load_image(image_input)
         if img is None:
-            print(f"Error: Could not load image from path: {image_input}")
+            logger.error(f"Could not load image from path: {image_input}")
             return None, None, None, None, None
     elif isinstance(image_input, np.ndarray):
-        img = image_input.copy() # Work on a copy to avoid modifying the original array
+        # Detection does not modify its input; a copy is only made once there is something to draw
+        img = image_input
     else:
-        print("Error: Invalid image_input type. Must be a path (str) or a NumPy array.")
-        return None, None, None, None, None
-
-    # Get the ArUco dictionary
-    try:
-        dictionary = cv2.aruco.getPredefinedDictionary(getattr(cv2.aruco, dictionary_name))
-    except AttributeError:
-        print(f"Error: Dictionary '{dictionary_name}' not found. Please check the dictionary name.")
+        logger.error("Invalid image_input type. Must be a path (str) or a NumPy array.")
         return None, None, None, None, None
 
-    # Create the ChArUco board object (same as in generation)
-    board = cv2.aruco.CharucoBoard((squares_x, squares_y), square_length_mm / 1000.0, marker_length_mm / 1000.0, dictionary)
-    # board = cv2.aruco.CharucoBoard((squares_x, squares_y), 0.01, 0.007, dictionary)
-    
-    # Set legacy pattern for older ChArUco boards
-    # board.setLegacyPattern(True)
-    
-    # --- NEW: Create CharucoParameters and DetectorParameters ---
-    # DetectorParameters for the underlying Aruco detection
-    detector_params = cv2.aruco.DetectorParameters()
-    # CharucoParameters for the ChArUco interpolation/detection
-    charuco_params = cv2.aruco.CharucoParameters()
-
-    # --- NEW: Pass charuco_params and detector_params to CharucoDetector ---
-    # The CharucoDetector constructor now expects (board, charucoParams, detectorParams)
-    charucoDetector = cv2.aruco.CharucoDetector(board, charuco_params, detector_params)
-
+    charucoDetector = detector
+    if charucoDetector is None:
+        charucoDetector = _get_detector(squares_x, squares_y, square_length_mm, marker_length_mm, dictionary_name,
+                                        tuple(sorted((detector_params or {}).items())))
+        if charucoDetector is None:
+            return None, None, None, None, None
 
     # Use detectBoard() to get charuco corners directly
-    charucoCorners, charucoIds, markerCorners, markerIds = charucoDetector.detectBoard(img)
+    if downscale > 1:
+        small = cv2.resize(img, None, fx=1 / downscale, fy=1 / downscale, interpolation=cv2.INTER_AREA)
+        charucoCorners, charucoIds, markerCorners, markerIds = _to_full_resolution(
+            img, 1 / downscale, *charucoDetector.detectBoard(small))
+    else:
+        charucoCorners, charucoIds, markerCorners, markerIds = charucoDetector.detectBoard(img)
+    if draw_on is not None:
+        img = draw_on
+    elif draw and img is image_input and not inplace and markerIds is not None and charucoIds is not None:
+        # Work on a copy to avoid modifying the caller's array
+        img = image_input.copy()
 
+    verbose = logger.isEnabledFor(logging.DEBUG)
     if markerIds is not None:
-        print(f"Detected {len(markerIds)} Aruco markers.")
+        if verbose:
+            logger.debug(f"Detected {len(markerIds)} Aruco markers.")
 
         if charucoIds is not None:
-            print(f"Detected {len(charucoIds)} ChArUco corners.")
-
-            # Draw the detected ChArUco corners
-            cv2.aruco.drawDetectedCornersCharuco(img, charucoCorners, charucoIds, cornerColor=(0, 255, 0))
+            if verbose:
+                logger.debug(f"Detected {len(charucoIds)} ChArUco corners.")
 
-            # Draw the individual ArUco markers (optional, as charuco detection is more robust)
-            cv2.aruco.drawDetectedMarkers(img, markerCorners, markerIds,  borderColor=(0, 0, 255))
+            # Draw the detected ChArUco corners and the individual ArUco markers
+            if draw:
+                draw_charuco_detections(img, charucoCorners, charucoIds, markerCorners, markerIds)
 
             # --- Pose Estimation (Optional, requires camera calibration) ---
             # If you have camera calibration parameters (camera_matrix, dist_coeffs),
@@ -123,9 +559,9 @@ def detect_charuco_board(image_input, squares_x, squares_y, square_length_mm, ma
             #     cv2.drawFrameAxes(img, camera_matrix, dist_coeffs, rvec, tvec, 0.05) # Draw axes on the board
 
         else:
-            print("No ChArUco corners detected from the Aruco markers.")
+            logger.debug("No ChArUco corners detected from the Aruco markers.")
     else:
-        print("No Aruco markers detected in the image.")
+        logger.debug("No Aruco markers detected in the image.")
 
     # Display the result
     if display:
@@ -136,31 +572,43 @@ def detect_charuco_board(image_input, squares_x, squares_y, square_length_mm, ma
     return img, charucoCorners, charucoIds, markerCorners, markerIds
 
 if __name__ == "__main__":
-    # --- Configuration for your specific board (MUST MATCH GENERATION SCRIPT) ---
-    squares_x = 5
-    squares_y = 5
-    board_width_cm = 5.0 # This is used to calculate square_length_mm
-    marker_length_mm = 7.0
-    dictionary_name = "DICT_4X4_100" # Ensure this matches the dictionary used for generation
+    # Defaults match the board in test_images (and the generation script)
+    parser = argparse.ArgumentParser(description="Detect a ChArUco board in an image.")
+    parser.add_argument("image", nargs="?", default="test_images/charuco_5x5_12markers_5cm.png",
+                        help="Path to the image to search (default: %(default)s).")
+    parser.add_argument("--squares-x", type=int, default=5, help="Squares in X direction (default: %(default)s).")
+    parser.add_argument("--squares-y", type=int, default=5, help="Squares in Y direction (default: %(default)s).")
+    parser.add_argument("--board-width-cm", type=float, default=5.0,
+                        help="Printed board width, used to compute the square length (default: %(default)s).")
+    parser.add_argument("--marker-length-mm", type=float, default=7.0, help="Marker side length (default: %(default)s).")
+    parser.add_argument("--dictionary", default="DICT_4X4_100", help="ArUco dictionary name (default: %(default)s).")
+    parser.add_argument("--no-display", action="store_true", help="Do not show the result in a window.")
+    parser.add_argument("--downscale", type=float, default=1,
+                        help="Search for markers on the image shrunk by this factor (default: %(default)s).")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Number of threads OpenCV may use (default: OpenCV's default).")
+    parser.add_argument("--aruco3", action="store_true",
+                        help="Use the ArUco3 fast detection mode (ARUCO3_DETECTOR_PARAMS). Misses boards that are small in the frame.")
+    args = parser.parse_args()
 
-    # Calculate square length based on desired board width
-    square_length_mm = (board_width_cm * 10.0) / squares_x
+    logging.basicConfig(level=logging.DEBUG, format='%(message)s')
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
 
-    # --- Specify the path to your image ---
-    # Make sure you have an image of the ChArUco board in the same directory,
-    # or provide the full path to the image.
-    image_to_detect = "test_images/charuco_5x5_12markers_5cm.png"
-    #image_to_detect = "test_images/IMG_20250521_184547226.jpg" 
-    #image_to_detect = "test_images/IMG_20250521_185417301.jpg"
+    board_width_cm = args.board_width_cm
+    # Calculate square length based on desired board width
+    square_length_mm = (board_width_cm * 10.0) / args.squares_x
 
     result = detect_charuco_board(
-        image_input=image_to_detect,
-        squares_x=squares_x,
-        squares_y=squares_y,
+        image_input=args.image,
+        squares_x=args.squares_x,
+        squares_y=args.squares_y,
         square_length_mm=square_length_mm,
-        marker_length_mm=marker_length_mm,
-        dictionary_name=dictionary_name,
-        display=True
+        marker_length_mm=args.marker_length_mm,
+        dictionary_name=args.dictionary,
+        display=not args.no_display,
+        detector_params=ARUCO3_DETECTOR_PARAMS if args.aruco3 else None,
+        downscale=args.downscale
     )
     
     # img is the first element of the tuple returned by detect_charuco_board
@@ -187,11 +635,11 @@ if __name__ == "__main__":
             print("Cannot compute pixel/cm equivalence: No ChArUco corners detected.")
 
         # Example of passing an already loaded image
-        # loaded_img = cv2.imread(image_to_detect)
+        # loaded_img = cv2.imread(args.image)
         # if loaded_img is not None:
         #     print("\nDetecting on a pre-loaded image:")
         #     img_from_array_tuple = detect_charuco_board(
-        #         loaded_img, squares_x, squares_y, square_length_mm, marker_length_mm, dictionary_name, display=False
+        #         loaded_img, args.squares_x, args.squares_y, square_length_mm, args.marker_length_mm, args.dictionary, display=False
         #     )
         #     if img_from_array_tuple[0] is not None:
         #         cv2.imwrite("detected_charuco_from_array.png", img_from_array_tuple[0])
@@ -5,6 +5,11 @@ import os
 import json
 import zlib
 import binascii # For robust hex decoding error handling
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
 
 def _decode_zlib_json_qr(qr_text_content):
     """
@@ -33,63 +38,51 @@ def _decode_zlib_json_qr(qr_text_content):
         # print(f"    Debug: Failed to decode/decompress QR content as zlib/JSON: {e}") # Optional
         return None
 
-def detect_and_draw_qrcodes(image_input):
-    """
-    Reads an image from disk, detects QR codes in it,
-    draws a green quadrilateral around each detected QR code, and attempts
-    to decode zlib-compressed JSON content from the QR text.
+@lru_cache(maxsize=1)
+def _get_detector():
+    """Returns the QReader shared by calls that do not pass their own, loading
+    its detection model on first use."""
+    return QReader()
 
-    Args:
-        image_input (str or numpy.ndarray): Path to the input image file or the image itself (as a NumPy array).
-    Returns:
-        tuple (list[numpy.ndarray], list[str], list[Optional[dict]]) or (None, None, None):
-            - A list of images:
-                - The first image is the input image with QR codes highlighted.
-                  If no QR codes are found, it's the original unmodified image.
-                - Subsequent images are cropped individual QR code regions.
-            - A list of strings, where each string is the decoded text of a
-              corresponding QR code. The order matches the cropped images.
-            - A list of decoded JSON objects (dict) or None if decoding failed
-              for the corresponding QR code text. The order matches the other lists.
-            Returns (None, None, None) if the image cannot be read or if input type is invalid.
-            Returns ([original_image], [], []) if no QR codes are found.
+def _load_qr_input(image_input):
+    """
+    Returns the BGR image to search for QR codes in: the image at a path, or
+    the given array itself. Logs an error and returns None if there is none.
     """
-    # Create a QReader instance
-    qreader_detector = QReader()
-
     if isinstance(image_input, str):
         # Input is a path, load the image
         original_image = cv2.imread(image_input)
         if original_image is None:
-            print(f"Error: Could not read image from path: '{image_input}'")
-            return None, None, None
+            logger.error(f"Could not read image from path: '{image_input}'")
+            return None
     elif isinstance(image_input, np.ndarray):
-        original_image = image_input.copy() # Work on a copy
+        # Only read from; outlines are drawn on a copy (see `_draw_and_crop_qrcodes`)
+        original_image = image_input
     else:
-        print(f"Error: Invalid input type. Expected string path or NumPy array, got {type(image_input)}.")
-        return None, None, None
+        logger.error(f"Invalid input type. Expected string path or NumPy array, got {type(image_input)}.")
+        return None
+    return original_image
 
+def _draw_and_crop_qrcodes(qreader_detector, image_input, original_image, detected_bboxes):
+    """
+    Decodes the QR codes QReader detected in an image, outlines them and crops
+    them. Returns the result described in `detect_and_draw_qrcodes`.
+    """
     # Initialize image_for_display with the original. It will be copied if modifications are made.
     image_for_display = original_image 
     cropped_qr_images = []
+    qr_polygons = [] # Outlines to draw, collected so they are drawn in a single cv2.polylines call
     decoded_texts_list = []
     decoded_json_objects_list = []
 
-    # QReader expects images in RGB format, OpenCV reads in BGR by default
-    # Use the original_image for conversion, as it's pristine.
-    rgb_img = cv2.cvtColor(original_image, cv2.COLOR_BGR2RGB)
-
-    # Step 1: Detect QR codes to get bounding boxes.
-    # qreader.detect() returns a list of bounding boxes (numpy arrays of points),
-    # or None if no QR codes are found.
-    detected_bboxes = qreader_detector.detect(image=rgb_img)
-
     if detected_bboxes:  # Handles None or an empty list
         # Determine the source for logging
         image_source_name = image_input if isinstance(image_input, str) else "the provided image array"
-        print(f"Found {len(detected_bboxes)} potential QR code(s) in {image_source_name}.")
+        logger.debug(f"Found {len(detected_bboxes)} potential QR code(s) in {image_source_name}.")
 
-        made_modifications_to_display_image = False
+        # QReader decodes RGB images. A reversed-channel view is enough, as it
+        # only crops the QR regions out of it, so the frame is never copied.
+        rgb_img = original_image[:, :, ::-1]
 
         for i, detection_info in enumerate(detected_bboxes):
             current_decoded_text = None
@@ -97,7 +90,7 @@ def detect_and_draw_qrcodes(image_input):
                 # Step 2: Decode the text for each detected QR code using its bounding box.
                 current_decoded_text = qreader_detector.decode(image=rgb_img, detection_result=detection_info)
             except Exception as e:
-                print(f"  Error decoding potential QR Code #{i+1}: {e}. Detection info: {detection_info}.")
+                logger.warning(f"Error decoding potential QR Code #{i+1}: {e}. Detection info: {detection_info}.")
                 continue # Skip to the next detection
 
             if current_decoded_text is not None:
@@ -106,30 +99,21 @@ def detect_and_draw_qrcodes(image_input):
 
                 if quad_corners is not None:
                     # This is a confirmed QR code with location.
-                    if not made_modifications_to_display_image:
-                        image_for_display = original_image.copy() # Copy before first drawing
-                        made_modifications_to_display_image = True
-                    
-                    print(f"  QR Code #{i+1} decoded: '{current_decoded_text[:50]}{'...' if len(current_decoded_text) > 50 else ''}'")
+                    logger.debug(f"QR Code #{i+1} decoded: '{current_decoded_text[:50]}{'...' if len(current_decoded_text) > 50 else ''}'")
                     try:
                         current_points = np.array(quad_corners, dtype=np.float32)
                         centroid = np.mean(current_points, axis=0)
                         expanded_points = centroid + 1.1 * (current_points - centroid)
 
                         img_height, img_width = original_image.shape[:2]
-                        expanded_points[:, 0] = np.clip(expanded_points[:, 0], 0, img_width - 1)
-                        expanded_points[:, 1] = np.clip(expanded_points[:, 1], 0, img_height - 1)
+                        np.clip(expanded_points, 0, (img_width - 1, img_height - 1), out=expanded_points)
 
-                        points_for_drawing = np.array(expanded_points, dtype=np.int32).reshape((-1, 1, 2))
-                        cv2.polylines(image_for_display, [points_for_drawing], isClosed=True, color=(0, 255, 0), thickness=4)
+                        # Round to the nearest pixel rather than truncating towards the top-left
+                        qr_polygons.append(np.rint(expanded_points).astype(np.int32).reshape((-1, 1, 2)))
 
                         # --- Crop the QR region from the original_image ---
-                        x_coords = expanded_points[:, 0]
-                        y_coords = expanded_points[:, 1]
-                        crop_x_start = int(np.min(x_coords))
-                        crop_y_start = int(np.min(y_coords))
-                        crop_x_end = int(np.max(x_coords)) + 1
-                        crop_y_end = int(np.max(y_coords)) + 1
+                        crop_x_start, crop_y_start = expanded_points.min(axis=0).astype(int)
+                        crop_x_end, crop_y_end = expanded_points.max(axis=0).astype(int) + 1
 
                         if crop_x_start < crop_x_end and crop_y_start < crop_y_end:
                             cropped_qr_img = original_image[crop_y_start:crop_y_end, crop_x_start:crop_x_end]
@@ -139,27 +123,94 @@ def detect_and_draw_qrcodes(image_input):
                                 json_obj = _decode_zlib_json_qr(current_decoded_text)
                                 decoded_json_objects_list.append(json_obj)
                             else:
-                                print(f"  QR Code #{i+1} (decoded) resulted in an empty crop slice. Not adding to results.")
+                                logger.warning(f"QR Code #{i+1} (decoded) resulted in an empty crop slice. Not adding to results.")
                         else:
-                            print(f"  QR Code #{i+1} (decoded) has invalid dimensions for cropping. Not adding to results.")
+                            logger.warning(f"QR Code #{i+1} (decoded) has invalid dimensions for cropping. Not adding to results.")
                     except (ValueError, TypeError) as e:
-                        print(f"  Error processing/drawing polygon for decoded QR Code #{i+1}: {e}. Quad corners: {quad_corners}. Not adding to results.")
+                        logger.warning(f"Error processing/drawing polygon for decoded QR Code #{i+1}: {e}. Quad corners: {quad_corners}. Not adding to results.")
                 else:
                     # Decoded, but no quad_corners
-                    print(f"  QR Code #{i+1} was decoded ('{current_decoded_text[:50]}...') but 'quad_xy' (corners) are missing. Cannot draw or crop.")
+                    logger.warning(f"QR Code #{i+1} was decoded ('{current_decoded_text[:50]}...') but 'quad_xy' (corners) are missing. Cannot draw or crop.")
             else:
                 # current_decoded_text is None: Detected by bbox, but not a decodable QR.
-                print(f"  Potential QR Code #{i+1} was detected by bounding box, but could not be decoded. No box drawn.")
+                logger.debug(f"Potential QR Code #{i+1} was detected by bounding box, but could not be decoded. No box drawn.")
     else:
         # No bounding boxes detected at all
         image_source_name = image_input if isinstance(image_input, str) else "the provided image array"
-        print(f"No QR codes found in {image_source_name}.")
+        logger.debug(f"No QR codes found in {image_source_name}.")
+
+    if qr_polygons:
+        # Draw all QR outlines at once on a copy; crops above come from the clean original_image.
+        image_for_display = original_image.copy()
+        cv2.polylines(image_for_display, qr_polygons, isClosed=True, color=(0, 255, 0), thickness=4)
 
     # If no modifications were made, image_for_display is still the original_image.
     # Otherwise, it's a copy with drawings.
     return [image_for_display] + cropped_qr_images, decoded_texts_list, decoded_json_objects_list
 
+def detect_and_draw_qrcodes(image_input, detector=None):
+    """
+    Reads an image from disk, detects QR codes in it,
+    draws a green quadrilateral around each detected QR code, and attempts
+    to decode zlib-compressed JSON content from the QR text.
+
+    Args:
+        image_input (str or numpy.ndarray): Path to the input image file or the image itself (as a NumPy array).
+        detector (QReader, optional): A QReader instance to use. If None, a
+            module-wide instance is created on the first call and reused, since
+            creating one loads the detection model.
+    Returns:
+        tuple (list[numpy.ndarray], list[str], list[Optional[dict]]) or (None, None, None):
+            - A list of images:
+                - The first image is a copy of the input image with QR codes highlighted.
+                  If no QR codes are found, it's the original unmodified image
+                  (the `image_input` array itself, if an array was given).
+                - Subsequent images are cropped individual QR code regions. They
+                  are views of the input image, so copy them before modifying it.
+            - A list of strings, where each string is the decoded text of a
+              corresponding QR code. The order matches the cropped images.
+            - A list of decoded JSON objects (dict) or None if decoding failed
+              for the corresponding QR code text. The order matches the other lists.
+            Returns (None, None, None) if the image cannot be read or if input type is invalid.
+            Returns ([original_image], [], []) if no QR codes are found.
+    """
+    # Use the shared QReader instance unless one was provided
+    qreader_detector = detector if detector is not None else _get_detector()
+
+    original_image = _load_qr_input(image_input)
+    if original_image is None:
+        return None, None, None
+
+    # Step 1: Detect QR codes to get bounding boxes.
+    # qreader.detect() returns a list of bounding boxes (numpy arrays of points),
+    # or None if no QR codes are found. Its YOLO model works on BGR images, so
+    # the image OpenCV loaded is passed as is rather than converted to RGB.
+    detected_bboxes = qreader_detector.detect(image=original_image, is_bgr=True)
+
+    return _draw_and_crop_qrcodes(qreader_detector, image_input, original_image, detected_bboxes)
+
+def write_images(output_paths, images, max_workers=None):
+    """
+    Writes images with `cv2.imwrite`, several at a time.
+
+    OpenCV releases the GIL while encoding and writing, so the images are
+    written in parallel by a thread pool.
+
+    Args:
+        output_paths (list of str): The files to write, one per image.
+        images (list of numpy.ndarray): The images to write.
+        max_workers (int, optional): Number of writer threads; defaults to the
+            number of CPUs.
+
+    Returns:
+        list of bool: Whether each image was written, in order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        return list(executor.map(cv2.imwrite, output_paths, images))
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG, format='%(message)s')
+
     # Note: The main block is for demonstration and testing.
     # Define the input and output image paths using absolute paths
     base_dir = "/Users/claudiograsso/Documents/Semillas/code/"
@@ -188,21 +239,14 @@ if __name__ == "__main__":
             # Get base name (including path) and extension from the input_image_abs_path
             input_path_basename, input_ext = os.path.splitext(input_image_abs_path)
 
-            # --- Save the main image (first in the list) ---
-            main_image_to_save = list_of_images[0]
-            # Construct the output path for the main image with detections
+            # --- Save the main image (first in the list) and the cropped QR images, if any ---
+            # e.g., /path/to/input_qr_all.jpg, /path/to/input_qr_1.jpg, /path/to/input_qr_2.jpg
             output_detections_abs_path = f"{input_path_basename}_qr_all{input_ext}"
-            cv2.imwrite(output_detections_abs_path, main_image_to_save)
+            cropped_qr_abs_paths = [f"{input_path_basename}_qr_{i + 1}{input_ext}" for i in range(len(list_of_images) - 1)]
+            write_images([output_detections_abs_path] + cropped_qr_abs_paths, list_of_images)
             print(f"Output image with detected QR codes saved to '{output_detections_abs_path}'")
-
-            # --- Save the cropped QR images, if any ---
-            if len(list_of_images) > 1:
-                for i, cropped_img in enumerate(list_of_images[1:]):
-                    # Construct the output path for each cropped QR image
-                    # e.g., /path/to/input_qr_1.jpg, /path/to/input_qr_2.jpg
-                    cropped_qr_abs_path = f"{input_path_basename}_qr_{i + 1}{input_ext}"
-                    cv2.imwrite(cropped_qr_abs_path, cropped_img)
-                    print(f"Saved cropped QR image to '{cropped_qr_abs_path}'")
+            for cropped_qr_abs_path in cropped_qr_abs_paths:
+                print(f"Saved cropped QR image to '{cropped_qr_abs_path}'")
             
             if decoded_qr_texts:
                 print("\nDecoded QR Code Texts:")
@@ -227,17 +271,13 @@ if __name__ == "__main__":
             images_from_array, texts_from_array, json_from_array = detect_and_draw_qrcodes(loaded_img_for_qr)
             if images_from_array:
                 input_path_basename, input_ext = os.path.splitext(input_image_abs_path)
-                # Save the main image from array processing
-                main_img_from_array = images_from_array[0]
+                # Save the main image and the cropped images from array processing
                 output_from_array_path = f"{input_path_basename}_qr_all_from_array{input_ext}"
-                cv2.imwrite(output_from_array_path, main_img_from_array)
+                cropped_qr_from_array_paths = [f"{input_path_basename}_qr_{i + 1}_from_array{input_ext}" for i in range(len(images_from_array) - 1)]
+                write_images([output_from_array_path] + cropped_qr_from_array_paths, images_from_array)
                 print(f"Output image (from array) with detected QR codes saved to '{output_from_array_path}'")
-                # Save cropped images from array processing
-                if len(images_from_array) > 1:
-                    for i, cropped_img_arr in enumerate(images_from_array[1:]):
-                        cropped_qr_from_array_path = f"{input_path_basename}_qr_{i + 1}_from_array{input_ext}"
-                        cv2.imwrite(cropped_qr_from_array_path, cropped_img_arr)
-                        print(f"Saved cropped QR image (from array) to '{cropped_qr_from_array_path}'")
+                for cropped_qr_from_array_path in cropped_qr_from_array_paths:
+                    print(f"Saved cropped QR image (from array) to '{cropped_qr_from_array_path}'")
                 if texts_from_array:
                     print("\nDecoded QR Code Texts (from array):")
                     for i, text in enumerate(texts_from_array):
@@ -0,0 +1,14 @@
+"""
+wsgi.py - WSGI entry point for production servers.
+
+Gunicorn (or any other WSGI server) should load `wsgi:application`, e.g.:
+
+    gunicorn --bind 0.0.0.0:8080 --worker-class gthread --threads 8 wsgi:application
+
+The processed-image store and result caches live in process memory, so the app
+is meant to scale with threads inside one worker (OpenCV releases the GIL)
+rather than with several worker processes.
+"""
+from app import app
+
+application = app